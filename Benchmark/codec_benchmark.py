@@ -0,0 +1,69 @@
+# payload size and encode / decode time of the ROS bridge codecs for one program message
+#   python Benchmark/codec_benchmark.py [--trajectory press_button_2nd_part] [--repeat 20]
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.socket_communication import decode_payload, encode_frame, make_codec
+from ROS.trajectory_library import TrajectoryLibrary
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def decode_frame(frame):
+    header = struct.unpack_from(">I", frame, 0)[0]
+    return decode_payload(header, memoryview(frame)[4:])
+
+def check_same_plan(message, decoded, atol):
+    for step, decoded_step in zip(message["steps"], decoded["steps"]):
+        for key, value in step.items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_allclose(np.asarray(decoded_step[key]), value, rtol=0, atol=atol)
+            elif decoded_step[key] != value:
+                raise AssertionError(f"{key}: {decoded_step[key]} != {value}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trajectory", default="press_button_2nd_part")
+    parser.add_argument("--tolerance", type=float, default=None, help="simplification tolerance in degree")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    library = TrajectoryLibrary(os.path.join(project_root_dir, "ROS", "trajectories"), tolerance_deg=args.tolerance)
+    plan = library.get(args.trajectory)
+    message = plan.to_message()
+    print(f"{args.trajectory}: {len(plan)} steps, {len(plan.joints)} waypoints")
+
+    json_codec = make_codec("json")
+    cases = (
+        ("json, text from TrajectoryPlan", lambda: encode_frame(plan.to_json(), json_codec), 0.0),
+        ("json codec", lambda: encode_frame(message, json_codec), 0.0),
+        ("binary float64", lambda: encode_frame(message, make_codec("binary")), 0.0),
+        ("binary float32", lambda: encode_frame(message, make_codec("binary32")), 1e-6),
+    )
+    baseline = None
+    for name, encode, atol in cases:
+        frame = encode()
+        check_same_plan(message, decode_frame(frame), atol)
+        encode_s = best_of(encode, args.repeat)
+        decode_s = best_of(lambda: decode_frame(frame), args.repeat)
+        if baseline is None:
+            baseline = (len(frame), encode_s + decode_s)
+        print(f"{name:32s} {len(frame) / 1e3:9.1f} kB  encode {encode_s * 1e3:7.3f} ms  decode {decode_s * 1e3:7.3f} ms"
+              f"  size x{baseline[0] / len(frame):.1f}  time x{baseline[1] / (encode_s + decode_s):.1f}")
+
+if __name__ == "__main__":
+    main()
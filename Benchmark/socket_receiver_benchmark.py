@@ -0,0 +1,124 @@
+# loopback throughput of NonBlockingJSONReceiver (GraspGen/common_utils/, the sync transport the
+# GraspGen server scripts use) against the original bytes buffer
+#   python Benchmark/socket_receiver_benchmark.py [--port 19870] [--repeat 3]
+
+import argparse
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from GraspGen.common_utils.socket_communication import NonBlockingJSONReceiver
+
+class LegacyNonBlockingJSONReceiver(NonBlockingJSONReceiver):
+    """capture_data as it was before the bytearray buffer, kept as the reference."""
+
+    def __init__(self, port, host="localhost"):
+        self._reset_legacy()
+        super().__init__(host=host, port=port)
+
+    def _reset_legacy(self):
+        self.legacy_buffer = b""
+        self.msg_len = None
+
+    def capture_data(self):
+        try:
+            if self.conn is None:
+                self.conn, addr = self.socket.accept()
+                self.conn.setblocking(False)
+                self._reset_legacy()
+            while True:
+                data = self.conn.recv(4096)
+                if not data:
+                    self.conn.close()
+                    self.conn = None
+                    return None
+                self.legacy_buffer += data
+        except BlockingIOError:
+            pass  # No data available
+
+        if self.msg_len is None:
+            if len(self.legacy_buffer) >= 4:
+                self.msg_len = struct.unpack(">I", self.legacy_buffer[:4])[0]
+                self.legacy_buffer = self.legacy_buffer[4:]
+            else:
+                return None
+        if len(self.legacy_buffer) < self.msg_len:
+            raise ValueError(
+                "Message length defined in the header is larger than the received buffer size, shouldn't happen"
+            )
+
+        message_bytes = self.legacy_buffer[: self.msg_len]
+        self.legacy_buffer = self.legacy_buffer[self.msg_len :]
+        self.msg_len = None
+        return json.loads(message_bytes.decode("utf-8"))
+
+    def capture_all(self):
+        # the original raised on frames that had only partly arrived, keep polling instead
+        messages = []
+        while True:
+            try:
+                message = self.capture_data()
+            except ValueError:
+                return messages
+            if message is None:
+                return messages
+            messages.append(message)
+
+def make_frame(size):
+    """One arm message of about size bytes, the payload the bridge actually receives."""
+    row = [0.123456789012345] * 6
+    num_rows = max(1, size // len(json.dumps(row)))
+    message_bytes = json.dumps({"type": "arm", "joints_values": [row] * num_rows}).encode("utf-8")
+    return struct.pack(">I", len(message_bytes)) + message_bytes
+
+def send_frames(port, frame, count):
+    conn = socket.create_connection(("localhost", port))
+    try:
+        for _ in range(count):
+            conn.sendall(frame)
+    finally:
+        conn.close()
+
+def run(receiver_class, port, frame, count):
+    receiver = receiver_class(port=port)
+    sender = threading.Thread(target=send_frames, args=(port, frame, count), daemon=True)
+    start = time.perf_counter()
+    sender.start()
+    received = 0
+    while received < count:
+        received += len(receiver.capture_all())
+    elapsed = time.perf_counter() - start
+    sender.join()
+    if receiver.conn:
+        receiver.conn.close()
+    receiver.disconnect()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=19870)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    for label, size, count in (("1 KB", 1024, 5000), ("1 MB", 1024 * 1024, 20)):
+        frame = make_frame(size)
+        results = []
+        for name, receiver_class in (("legacy bytes buffer", LegacyNonBlockingJSONReceiver),
+                                     ("bytearray + recv_into", NonBlockingJSONReceiver)):
+            elapsed = min(run(receiver_class, args.port, frame, count) for _ in range(args.repeat))
+            results.append(elapsed)
+            print(f"{label} x {count:5d}  {name:22s} {count / elapsed:10.0f} msg/s "
+                  f"{len(frame) * count / elapsed / 1e6:8.1f} MB/s")
+        print(f"{label} speedup x{results[0] / results[1]:.1f}")
+
+if __name__ == "__main__":
+    main()
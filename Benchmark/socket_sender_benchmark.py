@@ -0,0 +1,117 @@
+# per message send latency of NonBlockingJSONSender (GraspGen/common_utils/, the sync transport the
+# GraspGen server scripts use) against the original liveness check
+#   python Benchmark/socket_sender_benchmark.py [--port 19880] [--count 5000]
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import sys
+import time
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from GraspGen.common_utils.socket_communication import NonBlockingJSONSender, logger
+
+class LegacyNonBlockingJSONSender(NonBlockingJSONSender):
+    """send_data as it was before the liveness monitor, kept as the reference."""
+
+    def _configure_socket(self):
+        pass
+
+    def _start_monitor(self):
+        pass
+
+    def send_data(self, data: dict) -> bool:
+        if not self.socket:
+            if not self.reconnect():
+                return False
+
+        try:
+            ready_to_read, _, _ = select.select([self.socket], [], [], 0)
+            if ready_to_read:
+                if self.socket.recv(1, socket.MSG_PEEK) == b"":
+                    raise BrokenPipeError("Connection closed by peer")
+        except BrokenPipeError:
+            if self.reconnect():
+                return self.send_data(data)
+            else:
+                return False
+        except Exception:
+            return False
+
+        if not (isinstance(data, dict) or isinstance(data, list)):
+            return False
+
+        message_bytes = json.dumps(data).encode("utf-8")
+        header = struct.pack(">I", len(message_bytes))
+
+        try:
+            logger.debug(f"Sending signal: {data}")
+            self.socket.sendall(header + message_bytes)
+            logger.info("Sent!")
+            return True
+        except BrokenPipeError:
+            if self.reconnect():
+                return self.send_data(data)
+            return False
+        except Exception:
+            return False
+
+def drain(server):
+    conn, _ = server.accept()
+    while conn.recv(1 << 20):
+        pass
+    conn.close()
+
+def run(sender_class, port, message, count):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("localhost", port))
+    server.listen()
+    # the bridge is another process, keep the receiving end off this interpreter
+    receiver = multiprocessing.Process(target=drain, args=(server,), daemon=True)
+    receiver.start()
+
+    sender = sender_class(port=port)
+    latencies = np.empty(count)
+    for i in range(count):
+        start = time.perf_counter()
+        sender.send_data(message)
+        latencies[i] = time.perf_counter() - start
+    sender.disconnect()
+    receiver.join()
+    server.close()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=19880)
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    message = {"type": "gripper", "grip_type": "close", "wait_time": 1.5}
+    results = {}
+    for name, sender_class in (("select + peek per send", LegacyNonBlockingJSONSender),
+                               ("monitor thread + keepalive", NonBlockingJSONSender)):
+        # loopback timings are noisy, keep the run with the lowest median
+        runs = [run(sender_class, args.port, message, args.count) * 1e6 for _ in range(args.repeat)]
+        latencies = min(runs, key=np.median)
+        results[name] = latencies
+        print(f"{name:28s} mean {latencies.mean():7.1f} us  p50 {np.percentile(latencies, 50):7.1f} us  "
+              f"p99 {np.percentile(latencies, 99):7.1f} us")
+    legacy, current = results.values()
+    print(" ".join(f"{label} x{func(legacy) / func(current):.2f}" for label, func in
+                   (("mean", np.mean), ("p50", np.median), ("p99", lambda a: np.percentile(a, 99)))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# messages per second and round trip latency of the socket transports: the asyncio client in ROS/
+# that ROSCommunication and GraspGenCommunication use, and the sync classes in GraspGen/common_utils/
+# that the GraspGen server scripts use, against a loopback stand-in that acks every message like
+# the bridge does
+#   python Benchmark/socket_transport_benchmark.py [--output report.json] [--compare previous.json]
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import select
+import socket
+import struct
+import sys
+import time
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+
+MODULES = {
+    "ros": "ROS.socket_communication",
+    "graspgen": "GraspGen.common_utils.socket_communication",
+}
+# the GraspGen copy has no codec layer and only speaks JSON
+CODECS = {"ros": ("json", "binary", "binary32"), "graspgen": ("json",)}
+# stand-in receivers: the ROS client is measured against a bridge reading frames off a socket,
+# the GraspGen classes against either of their own receivers
+RECEIVERS = {"ros": ("socket",), "graspgen": ("blocking", "nonblocking")}
+# one gripper command up to the longest arm segment the trajectories produce
+PAYLOADS = (("gripper", 0), ("arm 10", 10), ("arm 100", 100), ("arm 600", 600))
+
+def make_payload(waypoints, arrays):
+    """A gripper step, or an arm step with waypoints joints and time stamps like TrajectoryPlan.step."""
+    if waypoints == 0:
+        return {"type": "gripper", "grip_type": "close", "wait_time": 1.5}
+    rng = np.random.default_rng(waypoints)
+    joints = rng.uniform(-np.pi, np.pi, (waypoints, 6))
+    time_stamps = np.arange(waypoints) / 30.0
+    if not arrays:
+        joints, time_stamps = joints.tolist(), time_stamps.tolist()
+    return {"type": "arm", "joints_values": joints, "time_stamps": time_stamps, "speed_factor": 1.0}
+
+def receive(receiver, strategy):
+    if strategy == "blocking":
+        message = receiver.capture_data()
+        return [] if message is None else [message]
+    select.select([receiver.conn or receiver.socket], [], [], 1.0)
+    return receiver.capture_all()
+
+def stand_in(module_name, strategy, port_in, port_out, ready):
+    """Receives with the given receiver class and acks every message, until {"type": "stop"}."""
+    logging.basicConfig(level=logging.ERROR)
+    module = importlib.import_module(module_name)
+    receiver_class = module.BlockingJSONReceiver if strategy == "blocking" else module.NonBlockingJSONReceiver
+    receiver = receiver_class(port=port_in)
+    ready.set()
+    sender = None
+    while True:
+        for message in receive(receiver, strategy):
+            if sender is None:
+                sender = module.NonBlockingJSONSender(port=port_out)
+            sender.send_data({"type": "ack"})
+            if message.get("type") == "stop":
+                sender.disconnect()
+                receiver.disconnect()
+                return
+
+def bridge_stand_in(port_in, port_out, ready):
+    """Decodes every frame of the ROS client like the bridge and acks it, until {"type": "stop"}."""
+    logging.basicConfig(level=logging.ERROR)
+    module = importlib.import_module(MODULES["ros"])
+    server = socket.create_server(("localhost", port_in))
+    ready.set()
+    conn, _ = server.accept()
+    reader = conn.makefile("rb")
+    sender = None
+    ack = module.encode_frame({"type": "ack"}, module.JSONCodec())
+    while True:
+        header = struct.unpack(">I", reader.read(4))[0]
+        message = module.decode_payload(header, reader.read(module.frame_length(header)))
+        if sender is None:
+            sender = socket.create_connection(("localhost", port_out))
+        sender.sendall(ack)
+        if message.get("type") == "stop":
+            sender.close()
+            reader.close()
+            conn.close()
+            server.close()
+            return
+
+def start_peer(target, args):
+    ready = multiprocessing.Event()
+    # the bridge is another process, keep it off this interpreter
+    peer = multiprocessing.Process(target=target, args=args + (ready,), daemon=True)
+    peer.start()
+    ready.wait(10)
+    return peer
+
+def summary(frame_bytes, count, latencies, elapsed):
+    latencies = latencies * 1e6
+    return {
+        "frame_bytes": frame_bytes,
+        "count": count,
+        "msgs_per_s": count / elapsed,
+        "mb_per_s": frame_bytes * count / elapsed / 1e6,
+        "latency_us": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p99": float(np.percentile(latencies, 99)),
+        },
+    }
+
+async def run_client_case(codec, payload, count, port):
+    """The ROS asyncio client against bridge_stand_in, sending and awaiting like run_case."""
+    module = importlib.import_module(MODULES["ros"])
+    peer = start_peer(bridge_stand_in, (port, port + 1))
+    client = module.AsyncJSONClient(port, port + 1)
+    await client.start()
+    client.codec = module.make_codec(codec)
+    frame_bytes = len(module.encode_frame(payload, client.codec))
+
+    for _ in range(min(count, 20)):
+        await client.send_data(payload)
+        await client.capture_data()
+
+    latencies = np.empty(count)
+    for i in range(count):
+        start = time.perf_counter()
+        await client.send_data(payload)
+        await client.capture_data()
+        latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await client.send_data(payload)
+    for _ in range(count):
+        await client.capture_data()
+    elapsed = time.perf_counter() - start
+
+    await client.send_data({"type": "stop"})
+    await client.capture_data()
+    peer.join(10)
+    await client.disconnect()
+    return summary(frame_bytes, count, latencies, elapsed)
+
+def run_case(module_key, codec, strategy, payload, count, port):
+    if module_key == "ros":
+        return asyncio.run(run_client_case(codec, payload, count, port))
+    module = importlib.import_module(MODULES[module_key])
+    acks = module.BlockingJSONReceiver(port=port + 1)
+    peer = start_peer(stand_in, (MODULES[module_key], strategy, port, port + 1))
+    sender = module.NonBlockingJSONSender(port=port)
+    frame_bytes = 4 + len(json.dumps(payload).encode("utf-8"))
+
+    # warm up the connections in both directions
+    for _ in range(min(count, 20)):
+        sender.send_data(payload)
+        acks.capture_data()
+
+    # round trips: one message, one ack
+    latencies = np.empty(count)
+    for i in range(count):
+        start = time.perf_counter()
+        sender.send_data(payload)
+        acks.capture_data()
+        latencies[i] = time.perf_counter() - start
+
+    # throughput: every message back to back, then the acks
+    start = time.perf_counter()
+    for _ in range(count):
+        sender.send_data(payload)
+    for _ in range(count):
+        acks.capture_data()
+    elapsed = time.perf_counter() - start
+
+    sender.send_data({"type": "stop"})
+    acks.capture_data()
+    peer.join(10)
+    sender.disconnect()
+    if acks.conn:
+        acks.conn.close()
+    acks.disconnect()
+    return summary(frame_bytes, count, latencies, elapsed)
+
+def case_key(result):
+    return (result["module"], result["codec"], result["receiver"], result["payload"])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=19960)
+    parser.add_argument("--count", type=int, default=1000, help="messages per case for the gripper payload")
+    parser.add_argument("--output", help="write the results to this JSON report")
+    parser.add_argument("--compare", help="JSON report of an earlier run to print ratios against")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {case_key(result): result for result in json.load(f)["results"]}
+
+    results = []
+    port = args.port
+    for module_key in MODULES:
+        for codec in CODECS[module_key]:
+            for strategy in RECEIVERS[module_key]:
+                for label, waypoints in PAYLOADS:
+                    payload = make_payload(waypoints, arrays=module_key == "ros")
+                    # fewer of the big messages, every case moves a similar amount of data
+                    count = max(50, args.count // max(1, waypoints // 10))
+                    result = {"module": module_key, "codec": codec, "receiver": strategy, "payload": label}
+                    result.update(run_case(module_key, codec, strategy, payload, count, port))
+                    port += 2
+                    results.append(result)
+                    latency = result["latency_us"]
+                    line = (f"{module_key:8s} {codec:8s} {strategy:11s} {label:8s} {result['frame_bytes'] / 1e3:8.1f} kB "
+                            f"{result['msgs_per_s']:9.0f} msg/s {result['mb_per_s']:7.1f} MB/s  "
+                            f"p50 {latency['p50']:8.1f} us  p99 {latency['p99']:8.1f} us")
+                    before = previous.get(case_key(result))
+                    if before:
+                        line += (f"  vs before: msg/s x{result['msgs_per_s'] / before['msgs_per_s']:.2f}"
+                                 f" p50 x{before['latency_us']['p50'] / latency['p50']:.2f}")
+                    print(line)
+
+    if args.output:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
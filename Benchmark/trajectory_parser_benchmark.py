@@ -0,0 +1,159 @@
+# compare the vectorized trajectory loader against the original row by row csv parser
+#   python Benchmark/trajectory_parser_benchmark.py [--repeat 5]
+# the loader was asked to be TARGET_SPEEDUP times faster on cold loads; the report says which
+# paths get there (so far only the warm compiled cache) and how far the cold ones are
+
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.trajectory_parser import (
+    Mode,
+    Movement,
+    status_open,
+    status_close,
+    status_half_open,
+    status_close_tight,
+    _parse_csv_rows,
+    _parse_rows,
+    classify_states,
+    load_trajectory_from_csv,
+    load_trajectory_states,
+)
+
+TARGET_SPEEDUP = 10.0
+
+def legacy_load_trajectory_from_csv(filename, delimiter=','):
+    """The parser as it was before the vectorized loader, kept as the reference."""
+    movements = []
+    index = 0
+    gripper_prev = None
+    with open(filename, 'r', newline='') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        for row in reader:
+            if index == 0:
+                index += 1
+                continue
+
+            joint_values = (row[0][1:len(row[0])-1]).split(', ')
+            joint_values_float = []
+
+            for joint in joint_values:
+                joint_values_float.append(float(joint))
+
+            if joint_values_float[6:9] == status_open:
+                if gripper_prev == None or (gripper_prev != None and gripper_prev != status_open):
+                    move = Movement(Mode.OPEN)
+                else:
+                    move = Movement(Mode.MOVE, joint_values_float[0:6])
+            elif joint_values_float[6:9] == status_close:
+                if gripper_prev == None or (gripper_prev != None and gripper_prev != status_close):
+                    move = Movement(Mode.CLOSE)
+                else:
+                    move = Movement(Mode.MOVE, joint_values_float[0:6])
+            elif joint_values_float[6:9] == status_half_open:
+                if gripper_prev == None or (gripper_prev != None and gripper_prev != status_half_open):
+                    move = Movement(Mode.HALF_OPEN)
+                else:
+                    move = Movement(Mode.MOVE, joint_values_float[0:6])
+            elif joint_values_float[6:9] == status_close_tight:
+                if gripper_prev == None or (gripper_prev != None and gripper_prev != status_close_tight):
+                    move = Movement(Mode.CLOSE_TIGHT)
+                else:
+                    move = Movement(Mode.MOVE, joint_values_float[0:6])
+            else:
+                move = Movement(Mode.MOVE, joint_values_float[0:6])
+
+            movements.append(move)
+            gripper_prev = joint_values_float[6:9]
+    return movements
+
+def check_same_movements(filename):
+    expected = legacy_load_trajectory_from_csv(filename)
+    actual = load_trajectory_from_csv(filename, use_cache=False)
+    if len(expected) != len(actual):
+        raise AssertionError(f"{filename}: {len(actual)} movements, expected {len(expected)}")
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if a.mode != b.mode or a.joint_value != b.joint_value:
+            raise AssertionError(f"{filename}: movement {i} differs ({b.mode}, {b.joint_value})")
+
+def check_exact_rows(content):
+    """The decoded state and timestamp columns equal float() of every field, to the last bit."""
+    actual = _parse_rows(content)
+    expected = _parse_csv_rows(content.decode('utf-8'))
+    if actual.shape != expected.shape or (actual != expected).any():
+        raise AssertionError("vectorized rows differ from float() of the csv fields")
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--trajectories", default=os.path.join(project_root_dir, "ROS", "trajectories"))
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.trajectories, "*.csv")))
+    contents = []
+    for filename in files:
+        check_same_movements(filename)
+        with open(filename, 'rb') as file:
+            contents.append(file.read())
+        check_exact_rows(contents[-1])
+    num_rows = sum(len(load_trajectory_states(f, use_cache=False)) for f in files)
+    print(f"{len(files)} trajectories, {num_rows} rows, results identical to the legacy parser and float()")
+
+    def legacy():
+        for filename in files:
+            legacy_load_trajectory_from_csv(filename)
+
+    def decode():
+        for content in contents:
+            _parse_rows(content)
+
+    def decode_and_classify():
+        for content in contents:
+            classify_states(_parse_rows(content)[:, 0:9])
+
+    def movements():
+        for filename in files:
+            load_trajectory_from_csv(filename, use_cache=False)
+
+    def cached():
+        for filename in files:
+            load_trajectory_states(filename)
+
+    cached()  # compile the cache once
+    baseline = best_of(legacy, args.repeat)
+    print(f"{'legacy csv parser -> Movement list':40s} {baseline * 1e3:9.3f} ms")
+    cold_speedups = []
+    for name, func, cold in (
+        ("vectorized decode -> (N, 10) array", decode, True),
+        ("vectorized decode + gripper transitions", decode_and_classify, True),
+        ("vectorized loader -> Movement list", movements, True),
+        ("compiled cache, warm", cached, False),
+    ):
+        elapsed = best_of(func, args.repeat)
+        speedup = baseline / elapsed
+        if cold:
+            cold_speedups.append(speedup)
+        mark = "meets" if speedup >= TARGET_SPEEDUP else "below"
+        print(f"{name:40s} {elapsed * 1e3:9.3f} ms  x{speedup:.1f}  ({mark} the x{TARGET_SPEEDUP:.0f} target)")
+    if max(cold_speedups) < TARGET_SPEEDUP:
+        print(f"cold loads reach x{min(cold_speedups):.1f}-x{max(cold_speedups):.1f}, short of the "
+              f"x{TARGET_SPEEDUP:.0f} target: parsing ~350 rows per file is bounded by the per-line regex "
+              f"and the Movement objects; only cached reloads are x{TARGET_SPEEDUP:.0f} faster or more")
+
+if __name__ == "__main__":
+    main()
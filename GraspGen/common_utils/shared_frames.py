@@ -0,0 +1,85 @@
+import logging
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SharedFrameWriter:
+    """
+    Hands camera frames (color, depth, point clouds, any numpy array) to a server on the same
+    host through POSIX shared memory. publish() copies an array into a named segment and
+    returns the descriptor that goes into the JSON request instead of the pixels:
+    {"name": ..., "shape": [...], "dtype": ..., "timestamp": ...}.
+    Every kind of frame has slots segments used in turn, so a request still in flight keeps
+    its frame while the next one is written. Segments are reused while the frames fit.
+    """
+
+    def __init__(self, prefix="robotsnack", slots=2):
+        self.prefix = f"{prefix}_{os.getpid()}"
+        self.slots = slots
+        self._segments = {}  # (kind, slot) -> SharedMemory
+        self._next_slot = {}
+
+    def _segment(self, kind, slot, size):
+        segment = self._segments.get((kind, slot))
+        if segment is not None and segment.size >= size:
+            return segment
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+        name = f"{self.prefix}_{kind}_{slot}"
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left over by a crashed run with the same pid
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._segments[(kind, slot)] = segment
+        return segment
+
+    def publish(self, kind, array, timestamp=None) -> dict:
+        array = np.ascontiguousarray(array)
+        slot = self._next_slot.get(kind, 0)
+        self._next_slot[kind] = (slot + 1) % self.slots
+        segment = self._segment(kind, slot, max(1, array.nbytes))
+        np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+        return {
+            "name": segment.name,
+            "shape": list(array.shape),
+            "dtype": array.dtype.str,
+            "timestamp": time.time() if timestamp is None else timestamp,
+        }
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments.clear()
+        logger.info("shared frames released")
+
+
+def read_frame(descriptor):
+    """A copy of the array a SharedFrameWriter published, for the server side."""
+    try:
+        segment = shared_memory.SharedMemory(name=descriptor["name"], track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the segment with this process' resource
+        # tracker, which would unlink it when this process exits
+        segment = shared_memory.SharedMemory(name=descriptor["name"])
+        resource_tracker.unregister(segment._name, "shared_memory")
+    try:
+        view = np.ndarray(descriptor["shape"], np.dtype(descriptor["dtype"]), buffer=segment.buf)
+        array = view.copy()
+        del view
+    finally:
+        segment.close()
+    return array
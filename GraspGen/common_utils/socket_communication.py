@@ -3,6 +3,8 @@ import json
 import logging
 import struct
 import select
+import threading
+import time
 # Some example joint configurations to send
 
 logger = logging.getLogger(__name__)
@@ -33,16 +35,34 @@ SAMPLE_DATA = {
 }
 
 
+def _time_left(deadline):
+    """Socket timeout until deadline (time.monotonic()), None without one."""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Deadline passed")
+    return left
+
+
 class NonBlockingJSONSender:
     """
     A class to manage connection and sending goals to the robot bridge.
     Connects automatically upon instantiation.
     """
 
-    def __init__(self, host="localhost", port=9870):
+    def __init__(self, host="localhost", port=9870, monitor_interval=0.5, max_retries=3, retry_delay=0.1):
         self.host = host
         self.port = port
         self.socket = None
+        # liveness is checked by a background thread, send_data only reads this flag
+        self.monitor_interval = monitor_interval
+        self.peer_closed = False
+        self._monitor_stop = None
+        self._monitor_thread = None
+        # reconnect attempts per send_data, waiting retry_delay, 2 * retry_delay, ... in between
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
         self._connect_on_init()  # Attempt connection during initialization
 
     def _connect_on_init(self):
@@ -57,6 +77,9 @@ class NonBlockingJSONSender:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
+            self._configure_socket()
+            self.peer_closed = False
+            self._start_monitor()
             logger.info(f"Sender connected to receiver at {self.host}:{self.port}")
             return True
         except ConnectionRefusedError:
@@ -74,11 +97,53 @@ class NonBlockingJSONSender:
         """
         Closes the connection to the robot bridge.
         """
+        self._stop_monitor()
         if self.socket:
             self.socket.close()
             self.socket = None
             logger.warning("Sender disconnected")
 
+    def _configure_socket(self):
+        """
+        Small frames go out immediately, and TCP keepalive notices a bridge host that
+        vanished without closing the connection.
+        """
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", 5), ("TCP_KEEPINTVL", 1), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, option):
+                self.socket.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def _start_monitor(self):
+        self._monitor_stop = threading.Event()
+        self._monitor_thread = threading.Thread(
+            target=self._monitor, args=(self.socket, self._monitor_stop), daemon=True
+        )
+        self._monitor_thread.start()
+
+    def _stop_monitor(self):
+        if self._monitor_thread is not None:
+            self._monitor_stop.set()
+            self._monitor_thread.join()
+            self._monitor_thread = None
+
+    def _monitor(self, sock, stop):
+        """
+        Sets peer_closed once the receiver closes the connection. The receiver never
+        writes on this connection, so a readable socket means EOF or an error.
+        """
+        while not stop.wait(self.monitor_interval):
+            try:
+                ready_to_read, _, _ = select.select([sock], [], [], 0)
+                # A recv with MSG_PEEK will not remove data from buffer.
+                # If it returns b'', the peer has closed the connection.
+                if ready_to_read and sock.recv(1, socket.MSG_PEEK) == b"":
+                    self.peer_closed = True
+                    return
+            except OSError:
+                self.peer_closed = True
+                return
+
     def reconnect(self) -> bool:
         """
         Closes the current connection and establishes a new one.
@@ -90,54 +155,46 @@ class NonBlockingJSONSender:
     def send_data(self, data: dict) -> bool:
         """
         Sends a single joint position goal to the robot bridge.
-        Attempts to reconnect if the connection is lost.
+        data is a dict or a list, or a str / bytes that is already JSON encoded.
+        Reconnects and resends up to max_retries times if the connection is lost.
         Returns True on successful send, False otherwise.
         """
-        if not self.socket:
-            logger.warning("Connection not established. Attempting to reconnect.")
-            if not self.reconnect():
-                return False
-
-        # Check if the socket is still alive before sending
-        try:
-            ready_to_read, _, _ = select.select([self.socket], [], [], 0)
-            if ready_to_read:
-                # If the socket is readable, it might be closed.
-                # A recv with MSG_PEEK will not remove data from buffer.
-                # If it returns b'', the peer has closed the connection.
-                if self.socket.recv(1, socket.MSG_PEEK) == b"":
-                    logger.warning("Receiver has closed the connection.")
-                    raise BrokenPipeError("Connection closed by peer")
-        except BrokenPipeError:
-            logger.warning("Connection lost. Attempting to reconnect and resend.")
-            if self.reconnect():
-                return self.send_data(data)  # Retry sending
-            else:
-                return False
-        except Exception as e:
-            logger.exception(f"An error occurred while checking socket status: {e}")
-            return False
-
-        if not (isinstance(data, dict) or isinstance(data, list)):
-            logger.error("data is not a dict or a list")
+        if isinstance(data, bytes):
+            message_bytes = data
+        elif isinstance(data, str):
+            message_bytes = data.encode("utf-8")
+        elif isinstance(data, dict) or isinstance(data, list):
+            message_bytes = json.dumps(data).encode("utf-8")
+        else:
+            logger.error("data is not a dict, a list or encoded JSON")
             return False
+        frame = struct.pack(">I", len(message_bytes)) + message_bytes
+
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(delay)
+                delay *= 2
+            if not self.socket:
+                logger.warning("Connection not established. Attempting to reconnect.")
+                if not self.reconnect():
+                    continue
+            elif self.peer_closed:
+                logger.warning("Receiver has closed the connection.")
+                if not self.reconnect():
+                    continue
 
-        message_bytes = json.dumps(data).encode("utf-8")
-        header = struct.pack(">I", len(message_bytes))
+            try:
+                logger.debug("Sending signal: %s", data)  # formatted only when debug logging is on
+                self.socket.sendall(frame)
+                logger.info("Sent!")
+                return True
+            except OSError as e:
+                logger.warning(f"Connection lost while sending: {e}. Attempting to reconnect.")
+                self.peer_closed = True
 
-        try:
-            logger.debug(f"Sending signal: {data}")
-            self.socket.sendall(header + message_bytes)
-            logger.info("Sent!")
-            return True
-        except BrokenPipeError:
-            logger.warning("Connection lost while sending. Attempting to reconnect.")
-            if self.reconnect():  # Try to reconnect
-                return self.send_data(data)  # Retry sending
-            return False
-        except Exception as e:
-            logger.exception(f"An error occurred while sending: {e}")
-            return False
+        logger.error(f"Failed to send after {self.max_retries + 1} attempts")
+        return False
 
 
 class NonBlockingJSONReceiver:
@@ -146,13 +203,18 @@ class NonBlockingJSONReceiver:
     Connects automatically upon instantiation.
     """
 
+    RECV_SIZE = 65536
+
     def __init__(self, host="localhost", port=9870):
         self.host = host
         self.port = port
         self.socket = None
         self.conn = None
-        self.buffer = b""
-        self.msg_len = None
+        # received bytes live in buffer[read_pos:write_pos], complete frames are parsed
+        # in place and partial frames stay there until the rest arrives
+        self.buffer = bytearray(self.RECV_SIZE)
+        self.read_pos = 0
+        self.write_pos = 0
         self._connect_on_init()  # Attempt connection during initialization
 
     def _connect_on_init(self):
@@ -189,22 +251,62 @@ class NonBlockingJSONReceiver:
             self.socket = None
             logger.info("receiver disconnected")
 
-    def capture_data(self):
+    def _reset_buffer(self):
+        self.read_pos = 0
+        self.write_pos = 0
+
+    def _reserve(self, n):
+        """Makes room for n bytes after write_pos, moving unread data to the front or growing the buffer."""
+        if len(self.buffer) - self.write_pos >= n:
+            return
+        unread = self.write_pos - self.read_pos
+        if self.read_pos > 0:
+            with memoryview(self.buffer) as view:
+                view[:unread] = view[self.read_pos:self.write_pos]
+            self.read_pos, self.write_pos = 0, unread
+        if len(self.buffer) - self.write_pos < n:
+            buffer = bytearray(max(2 * len(self.buffer), self.write_pos + n))
+            with memoryview(self.buffer) as view:
+                buffer[:self.write_pos] = view[:self.write_pos]
+            self.buffer = buffer
+
+    def _pending_frame_size(self):
+        """Bytes still missing to complete the first buffered frame, at least RECV_SIZE."""
+        unread = self.write_pos - self.read_pos
+        if unread < 4:
+            return self.RECV_SIZE
+        msg_len = struct.unpack_from(">I", self.buffer, self.read_pos)[0]
+        return max(self.RECV_SIZE, 4 + msg_len - unread)
+
+    def _drop_partial_frame(self):
+        """Keeps only the complete frames, used when the sender went away mid-frame."""
+        pos = self.read_pos
+        while self.write_pos - pos >= 4:
+            end = pos + 4 + struct.unpack_from(">I", self.buffer, pos)[0]
+            if end > self.write_pos:
+                break
+            pos = end
+        self.write_pos = pos
+
+    def _receive(self):
+        """Reads everything the socket has available into the buffer."""
         try:
             if self.conn is None:
                 self.conn, addr = self.socket.accept()
                 self.conn.setblocking(False)
-                self.buffer = b""
-                self.msg_len = None
+                self._drop_partial_frame()
                 logger.info(f"Accepted connection from {addr}")
-
-            data = self.conn.recv(4096)
-            if not data:
-                logger.warning("Sender disconnected.")
-                self.conn.close()
-                self.conn = None
-                return None
-            self.buffer += data
+            while True:
+                self._reserve(self._pending_frame_size())
+                with memoryview(self.buffer) as view:
+                    n = self.conn.recv_into(view[self.write_pos:])
+                if n == 0:
+                    logger.warning("Sender disconnected.")
+                    self.conn.close()
+                    self.conn = None
+                    self._drop_partial_frame()
+                    return
+                self.write_pos += n
         except BlockingIOError:
             pass  # No data available
         except Exception as e:
@@ -212,27 +314,46 @@ class NonBlockingJSONReceiver:
             if self.conn:
                 self.conn.close()
             self.conn = None
-            return None
-
-        # Process buffer for a complete message
-        if self.msg_len is None:
-            if len(self.buffer) >= 4:
-                self.msg_len = struct.unpack(">I", self.buffer[:4])[0]
-                self.buffer = self.buffer[4:]
-            else:
-                return None  # Not enough data for header
-
-        if len(self.buffer) >= self.msg_len:
-            message_bytes = self.buffer[: self.msg_len]
-            self.buffer = self.buffer[self.msg_len :]
-            self.msg_len = None  # Reset for next message
-            try:
-                return json.loads(message_bytes.decode("utf-8"))
-            except json.JSONDecodeError as e:
-                logger.exception(f"JSON decode error: {e}")
-                return None
+            self._drop_partial_frame()
+
+    def _next_message(self):
+        """
+        Pops the first complete frame from the buffer. Returns (True, message) or
+        (False, None) if no complete frame is buffered; message is None if it was not valid JSON.
+        """
+        unread = self.write_pos - self.read_pos
+        if unread < 4:
+            return False, None
+        msg_len = struct.unpack_from(">I", self.buffer, self.read_pos)[0]
+        if unread < 4 + msg_len:
+            return False, None  # Partial frame, wait for the rest
+        start = self.read_pos + 4
+        self.read_pos = start + msg_len
+        try:
+            with memoryview(self.buffer) as view:
+                return True, json.loads(str(view[start:self.read_pos], "utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.exception(f"JSON decode error: {e}")
+            return True, None
+        finally:
+            if self.read_pos == self.write_pos:
+                self._reset_buffer()
 
-        return None  # Not enough data for full message
+    def capture_data(self):
+        """Returns the next complete message, or None if none has fully arrived yet."""
+        self._receive()
+        return self._next_message()[1]
+
+    def capture_all(self):
+        """Returns every complete message received so far, oldest first."""
+        self._receive()
+        messages = []
+        while True:
+            found, message = self._next_message()
+            if not found:
+                return messages
+            if message is not None:
+                messages.append(message)
 
 
 class BlockingJSONReceiver:
@@ -281,48 +402,81 @@ class BlockingJSONReceiver:
             self.socket = None
             logger.info("receiver disconnected")
 
-    def _read_blocking(self, n):
-        """Helper to read exactly n bytes from a blocking socket."""
-        data = b""
+    def send_data(self, data) -> bool:
+        """Replies on the accepted connection, for peers that asked for duplex."""
+        if self.conn is None:
+            logger.error("No sender connected to reply to")
+            return False
+        message_bytes = json.dumps(data).encode("utf-8")
+        try:
+            self.conn.sendall(struct.pack(">I", len(message_bytes)) + message_bytes)
+            return True
+        except OSError as e:
+            logger.warning(f"Connection lost while replying: {e}")
+            return False
+
+    def _close_conn(self):
+        if self.conn:
+            self.conn.close()
+        self.conn = None
+
+    def _read_blocking(self, n, deadline=None):
+        """
+        Helper to read exactly n bytes from a blocking socket. Returns None if the sender
+        disconnected, raises TimeoutError once deadline (time.monotonic()) has passed.
+        """
+        data = bytearray()
         while len(data) < n:
-            packet = self.conn.recv(n - len(data))
+            try:
+                self.conn.settimeout(_time_left(deadline))
+                packet = self.conn.recv(n - len(data))
+            except TimeoutError:
+                if data:
+                    self._close_conn()  # the rest of the frame would be read as the next one
+                raise
             if not packet:
                 return None
             data += packet
-        return data
-
-    def capture_data(self):
-        try:
-            if self.conn is None:
-                self.conn, addr = self.socket.accept()
-                logger.info(f"Accepted connection from {addr}")
-
-            header_data = self._read_blocking(4)
-            if not header_data:
-                logger.warning("Sender disconnected. Re-accepting... ")
-                self.conn.close()
-                self.conn = None
-                return self.capture_data()  # Wait for new connection
+        return bytes(data)
 
-            msg_len = struct.unpack(">I", header_data)[0]
-
-            message_bytes = self._read_blocking(msg_len)
-            if not message_bytes:
-                logger.warning("Sender disconnected. Re-accepting... ")
-                self.conn.close()
-                self.conn = None
-                return self.capture_data()  # Wait for new connection
+    def capture_data(self, timeout=None):
+        """
+        Returns the next message, accepting a new sender whenever the current one disconnects.
+        Raises TimeoutError if no message arrived within timeout seconds, None waits forever.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                if self.conn is None:
+                    self.socket.settimeout(_time_left(deadline))
+                    self.conn, addr = self.socket.accept()
+                    logger.info(f"Accepted connection from {addr}")
+
+                header_data = self._read_blocking(4, deadline)
+                if header_data is None:
+                    logger.warning("Sender disconnected. Re-accepting... ")
+                    self._close_conn()
+                    continue  # Wait for new connection
+
+                msg_len = struct.unpack(">I", header_data)[0]
+                try:
+                    message_bytes = self._read_blocking(msg_len, deadline)
+                except TimeoutError:
+                    self._close_conn()  # the rest of the frame would be read as the next one
+                    raise
+                if message_bytes is None:
+                    logger.warning("Sender disconnected. Re-accepting... ")
+                    self._close_conn()
+                    continue  # Wait for new connection
 
-            return json.loads(message_bytes.decode("utf-8"))
-        except (json.JSONDecodeError, struct.error) as e:
-            logger.exception(f"Data format error: {e}")
-            if self.conn:
-                self.conn.close()
-            self.conn = None
-            return None
-        except Exception as e:
-            logger.exception(f"Socket server error: {e}")
-            if self.conn:
-                self.conn.close()
-            self.conn = None
-            return None
+                return json.loads(message_bytes.decode("utf-8"))
+            except TimeoutError:
+                raise
+            except (json.JSONDecodeError, struct.error) as e:
+                logger.exception(f"Data format error: {e}")
+                self._close_conn()
+                return None
+            except Exception as e:
+                logger.exception(f"Socket server error: {e}")
+                self._close_conn()
+                return None
@@ -1,20 +1,101 @@
-from GraspGen.common_utils.socket_communication import (
-    NonBlockingJSONSender,
-    BlockingJSONReceiver,
+import asyncio
+import logging
+
+from ROS.socket_communication import (
+    AsyncJSONClient,
+    EventLoopThread,
+    is_hello_reply,
 )
+from GraspGen.common_utils.shared_frames import SharedFrameWriter
 
-class GraspGenCommunication:
-    def __init__(self, port_sender=9890, port_receiver=9891):
-        self.sender = NonBlockingJSONSender(port=port_sender)
-        self.receiever = BlockingJSONReceiver(port=port_receiver)
+logger = logging.getLogger(__name__)
+
+# servers that do not know the hello may never answer it
+HELLO_TIMEOUT_S = 2.0
+# a request that gets no reply within DEFAULT_DEADLINE_S fails with TimeoutError instead of
+# blocking the caller forever; generating a grasp and running it on the robot takes far less
+DEFAULT_DEADLINE_S = 60.0
+
+class AsyncGraspGenCommunication:
+    """GraspGen client on asyncio, call start() on the event loop before anything else."""
 
-    def send_data(self, data):
+    def __init__(self, port_sender=9890, port_receiver=9891, duplex=False, deadlines=True):
+        self.client = AsyncJSONClient(port_sender, port_receiver)
+        # ask the server to reply on the sender connection, so it needs no connection back
+        self.duplex = duplex
+        # wait at most deadline() for each reply, False waits forever
+        self.deadlines = deadlines
+        self._hello_connection = None
+        # frames for the local server travel through shared memory, not the socket
+        self.frames = SharedFrameWriter()
+
+    async def start(self):
+        await self.client.start()
+
+    def deadline(self):
+        """Reply timeout of a request, None for no timeout."""
+        return DEFAULT_DEADLINE_S if self.deadlines else None
+
+    async def negotiate_duplex(self):
+        """
+        Sends {"type": "hello", "duplex": true} once per sender connection. Servers that answer
+        {"type": "hello", "duplex": true} on that connection reply there from then on.
+        """
+        if not self.duplex:
+            return
+        await self.client.ensure_connected()
+        if self._hello_connection == self.client.connection_id:
+            return
+        self._hello_connection = self.client.connection_id
         try:
-            self.sender.send_data(data)
-            return self.receiever.capture_data()
-        except Exception as e:
-            raise e
+            # a late answer is dropped, anything else still goes to the requests after the hello
+            reply = await self.client.request({"type": "hello", "duplex": True}, HELLO_TIMEOUT_S, is_hello_reply,
+                                              may_not_reply=True)
+        except asyncio.TimeoutError:
+            reply = None
+        if is_hello_reply(reply) and reply.get("duplex"):
+            self.client.duplex = True
+            logger.info("GraspGen server replies on the sender connection")
+        else:
+            logger.warning("GraspGen server did not accept duplex, replies come on a second connection")
+
+    async def send_data(self, data, timeout=None, frames=None):
+        """
+        Sends one request and returns the reply; raises TimeoutError after timeout seconds,
+        deadline() by default.
+        frames ({kind: numpy array}, e.g. color, depth) are put in shared memory and the request
+        carries only their descriptors under "frames", see SharedFrameWriter.
+        """
+        if frames:
+            data = dict(data, frames={kind: self.frames.publish(kind, array) for kind, array in frames.items()})
+        await self.negotiate_duplex()
+        if timeout is None:
+            timeout = self.deadline()
+        try:
+            return await self.client.request(data, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"GraspGen server did not answer within {timeout:.1f} s") from None
+
+    async def quit(self):
+        await self.client.disconnect()
+        self.frames.close()
+
+class GraspGenCommunication:
+    """Blocking front end of AsyncGraspGenCommunication, see ROSCommunication."""
+
+    def __init__(self, port_sender=9890, port_receiver=9891, duplex=False, deadlines=True, loop_thread=None):
+        self._owns_loop = loop_thread is None
+        self.loop_thread = EventLoopThread() if loop_thread is None else loop_thread
+        self.comm = AsyncGraspGenCommunication(port_sender, port_receiver, duplex, deadlines)
+        self.loop_thread.run(self.comm.start())
+
+    def submit(self, coro):
+        return self.loop_thread.submit(coro)
+
+    def send_data(self, data, timeout=None, frames=None):
+        return self.loop_thread.run(self.comm.send_data(data, timeout, frames))
 
     def quit(self):
-        self.sender.disconnect()
-        self.receiever.disconnect()
\ No newline at end of file
+        self.loop_thread.run(self.comm.quit())
+        if self._owns_loop:
+            self.loop_thread.stop()
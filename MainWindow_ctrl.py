@@ -7,12 +7,15 @@ from Camera.camera import *
 from GraspGen.graspgen_comm import *
 from PeanutNumberClassification.PeanutNumClassification import *
 from ROS.trajectory_parser import *
+from ROS.trajectory_library import *
 from ROS.ros_comm import *
+from ROS.socket_communication import EventLoopThread
 from Uart.Wok import *
 from TCP.TCP import *
 
 import cv2
 import json
+import math
 import numpy as np
 from enum import Enum
 import threading
@@ -72,6 +75,23 @@ class main_window_ctrl(QMainWindow):
         self.first_start_time = 0
         self.left_seconds = 0
         self.reheat = False
+        self.trajectory_tolerance_deg = 1.0 # max joint deviation when simplifying recorded waypoints, None to send them all
+        self.trajectory_speed_factor = 1.0 # replay speed of the recorded demos, 1.5 = 1.5x faster than recorded
+        self.trajectory_speed_factors = {} # per trajectory override, e.g. {"go_to_default": 1.5}
+        # the settings below make the client send a hello; the ROS bridge does not answer it yet,
+        # so they stay off until a bridge that repeats request IDs and replies on one connection ships
+        self.ros_codec = "json" # "binary" / "binary32" sends joint arrays raw if the bridge agrees
+        self.ros_window = 1 # steps sent ahead of their reply when the bridge repeats request IDs, 1 = off
+        self.ros_duplex = False # replies on the same connection if the bridge agrees, else the 9894 listener
+        self.graspgen_frames = False # hand our camera frame to a GraspGen server on this host, else it captures itself
+        # one event loop for the GraspGen and ROS clients, so their requests can be awaited together
+        self.comm_loop = EventLoopThread()
+        self.recipes = {
+            "cook_1st_stove": ["grab_1st_batter", "pour_1st_batter", "drop_1st_batter", "close_1st_lid"],
+            "cook_2nd_stove": ["grab_2nd_batter", "pour_2nd_batter", "drop_2nd_batter", "close_2nd_lid"],
+            "serve_1st_stove": ["open_1st_lid", "grab_fork", "get_1st_waffle", "drop_waffle", "drop_fork"],
+            "serve_2nd_stove": ["open_2nd_lid", "grab_fork", "get_2nd_waffle", "drop_waffle", "drop_fork"],
+        }
 
         if 'self.PeanutNumClassifier' not in globals():
             try:
@@ -87,6 +107,13 @@ class main_window_ctrl(QMainWindow):
                 self.ui.textEdit_status.append(f"GraspGenCommunication_init error: {e}\n")
                 return
         
+        if 'self.trajectories' not in globals():
+            try:
+                self.trajectory_init()
+            except Exception as e:
+                self.ui.textEdit_status.append(f"trajectory_init error: {e}\n")
+                return
+
         if 'self.rosCommunication' not in globals():
             try:
                 self.ros_init()
@@ -117,7 +144,6 @@ class main_window_ctrl(QMainWindow):
 
         self.num_left_waffle = 0
         self.grabbing_spoon = False
-        self.grabbing_fork = False
         self.on_off = False          
 
         self.time_peanut_spoon = 20
@@ -131,6 +157,7 @@ class main_window_ctrl(QMainWindow):
         self.time_waffle_heat = 120
         self.time_waffle_serve = 30
         self.time_waffle_2nd_stove = 30
+        self.update_time_estimates()
 
     #region init
     def tcp_init(self):
@@ -161,7 +188,7 @@ class main_window_ctrl(QMainWindow):
 
     def GraspGenCommunication_init(self):
         try:
-            self.graspGenCommunication = GraspGenCommunication()
+            self.graspGenCommunication = GraspGenCommunication(loop_thread=self.comm_loop)
         except Exception as e:
             self.ui.textEdit_status.append(f"GraspGenCommunication_init error: {e}\n")
 
@@ -172,9 +199,30 @@ class main_window_ctrl(QMainWindow):
         except Exception as e:
             self.ui.textEdit_status.append(f"GraspGenCommunication_destroy error: {e}\n")
 
+    def trajectory_init(self):
+        self.trajectories = TrajectoryLibrary("ROS/trajectories",
+                                              tolerance_deg=self.trajectory_tolerance_deg,
+                                              speed_factor=self.trajectory_speed_factor,
+                                              speed_factors=self.trajectory_speed_factors)
+
+    def update_time_estimates(self):
+        # robot motions are estimated from the trajectories, heating and refilling stay fixed
+        try:
+            estimate = lambda name: int(math.ceil(self.trajectories.estimate(name)))
+            self.time_peanut_spoon = estimate("spoon_peanuts")
+            self.time_peanut_grab_spoon = estimate("get_spoon")
+            self.time_peanut_drop_spoon = estimate("drop_spoon")
+            self.time_waffle_pour = estimate(self.recipes["cook_1st_stove"])
+            self.time_waffle_serve = estimate(self.recipes["serve_1st_stove"])
+            self.time_waffle_2nd_stove = estimate(self.recipes["cook_2nd_stove"]) + estimate(self.recipes["serve_2nd_stove"])
+            self.ui.textEdit_status.append(f"Estimated seconds: spoon peanuts {self.time_peanut_spoon}, pour waffle {self.time_waffle_pour}, serve waffle {self.time_waffle_serve}.\n")
+        except Exception as e:
+            self.ui.textEdit_status.append(f"update_time_estimates error: {e}\n")
+
     def ros_init(self):        
         try:
-            self.rosCommunication = ROSCommunication()
+            self.rosCommunication = ROSCommunication(codec=self.ros_codec, window=self.ros_window,
+                                                     duplex=self.ros_duplex, loop_thread=self.comm_loop)
         except Exception as e:
             self.ui.textEdit_status.append(f"ros_init error: {e}\n")
 
@@ -284,7 +332,14 @@ class main_window_ctrl(QMainWindow):
                 self.drop_spoon()
 
             data = {"actions": "Grasp_and_Dump"}
-            message = self.graspGenCommunication.send_data(data)
+            # hand the server our latest frame so it does not capture the scene again
+            frames = None
+            if self.graspgen_frames:
+                try:
+                    frames = {"color": self.cam.capture_single(2)}
+                except Exception as e:
+                    self.ui.textEdit_status.append(f"capture for GraspGen failed, server captures itself: {e}\n")
+            message = self.graspGenCommunication.send_data(data, frames=frames)
             self.ui.textEdit_status.append(f"graspGenCommunication return message: {message}\n")
          except Exception as e:
             self.ui.textEdit_status.append(f"pushButton_GrabNDumpPeanuts_clicked error: {e}\n")
@@ -304,8 +359,7 @@ class main_window_ctrl(QMainWindow):
     #region peanuts related
     def press_button(self):
         try:
-            self.run_trajectory("ROS/trajectories/press_button1.csv")
-            self.run_trajectory("ROS/trajectories/press_button2.csv")
+            self.run_trajectory(["press_button1", "press_button2"])
         except Exception as e:
             self.ui.textEdit_status.append(f"press_button error: {e}\n")
 
@@ -316,7 +370,7 @@ class main_window_ctrl(QMainWindow):
             # if status_peanuts == 'insufficient' or status_peanuts == 'operating':
             #     return
 
-            self.run_trajectory("ROS/trajectories/get_spoon.csv")
+            self.run_trajectory("get_spoon")
             self.grabbing_spoon = True
         except Exception as e:
             self.ui.textEdit_status.append(f"get_spoon error: {e}\n")
@@ -334,7 +388,7 @@ class main_window_ctrl(QMainWindow):
 
     def spoon_single_peanuts(self):
         try:
-            self.run_trajectory("ROS/trajectories/spoon_peanuts.csv")
+            self.run_trajectory("spoon_peanuts")
         except Exception as e:
             raise e
 
@@ -404,7 +458,7 @@ class main_window_ctrl(QMainWindow):
 
     def drop_spoon(self):
         try:
-            self.run_trajectory("ROS/trajectories/drop_spoon.csv")
+            self.run_trajectory("drop_spoon")
             self.grabbing_spoon = False
         except Exception as e:
             self.ui.textEdit_status.append(f"drop_spoon error: {e}\n")
@@ -426,7 +480,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/open_1st_lid.csv")
+            self.run_trajectory("open_1st_lid")
         except Exception as e:
             self.ui.textEdit_status.append(f"open_1st_lid error: {e}\n")
 
@@ -435,7 +489,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/open_2nd_lid.csv")
+            self.run_trajectory("open_2nd_lid")
         except Exception as e:
             self.ui.textEdit_status.append(f"open_2nd_lid error: {e}\n")
 
@@ -444,7 +498,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/grab_1st_batter.csv")
+            self.run_trajectory("grab_1st_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"grab_1st_batter error: {e}\n")
 
@@ -453,7 +507,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/grab_2nd_batter.csv")
+            self.run_trajectory("grab_2nd_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"grab_2nd_batter error: {e}\n")
 
@@ -462,7 +516,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/pour_1st_batter.csv")
+            self.run_trajectory("pour_1st_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"pour_1st_batter error: {e}\n")
 
@@ -471,7 +525,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/pour_2nd_batter.csv")
+            self.run_trajectory("pour_2nd_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"pour_2nd_batter error: {e}\n")
 
@@ -480,7 +534,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/drop_1st_batter.csv")
+            self.run_trajectory("drop_1st_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"drop_1st_batter error: {e}\n")    
 
@@ -489,7 +543,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/drop_2nd_batter.csv")
+            self.run_trajectory("drop_2nd_batter")
         except Exception as e:
             self.ui.textEdit_status.append(f"drop_2nd_batter error: {e}\n")    
 
@@ -498,7 +552,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/close_1st_lid.csv")
+            self.run_trajectory("close_1st_lid")
         except Exception as e:
             self.ui.textEdit_status.append(f"close_1st_lid error: {e}\n")
 
@@ -507,7 +561,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/close_2nd_lid.csv")
+            self.run_trajectory("close_2nd_lid")
         except Exception as e:
             self.ui.textEdit_status.append(f"close_2nd_lid error: {e}\n")
 
@@ -516,8 +570,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/grab_fork.csv")
-            self.grabbing_fork = True
+            self.run_trajectory("grab_fork")
         except Exception as e:
             self.ui.textEdit_status.append(f"grab_fork error: {e}\n")
 
@@ -526,8 +579,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/drop_fork.csv")
-            self.grabbing_fork = False
+            self.run_trajectory("drop_fork")
         except Exception as e:
             self.ui.textEdit_status.append(f"drop_fork error: {e}\n")
 
@@ -536,7 +588,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/get_1st_waffle.csv")
+            self.run_trajectory("get_1st_waffle")
         except Exception as e:
             self.ui.textEdit_status.append(f"get_1st_waffle error: {e}\n")
 
@@ -545,7 +597,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/get_2nd_waffle.csv")
+            self.run_trajectory("get_2nd_waffle")
         except Exception as e:
             self.ui.textEdit_status.append(f"get_2nd_waffle error: {e}\n")
 
@@ -554,7 +606,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/drop_waffle.csv")
+            self.run_trajectory("drop_waffle")
         except Exception as e:
             self.ui.textEdit_status.append(f"drop_waffle error: {e}\n")
 
@@ -563,7 +615,7 @@ class main_window_ctrl(QMainWindow):
             if self.grabbing_spoon == True:
                 self.drop_spoon()
 
-            self.run_trajectory("ROS/trajectories/go_to_default.csv")
+            self.run_trajectory("go_to_default")
         except Exception as e:
             self.ui.textEdit_status.append(f"go_to_default error: {e}\n")
 
@@ -577,31 +629,31 @@ class main_window_ctrl(QMainWindow):
         except Exception as e:
             self.ui.textEdit_status.append(f"Serve Waffle error: {e}\n")
 
+    # recipes run as one chained trajectory, see TrajectoryLibrary.chain_report for the merged junctions
     def cook_1st_stove(self):
-        self.pushButton_Grab1stBatter_clicked()
-        self.pushButton_Pour1stBatter_clicked()
-        self.pushButton_Drop1stBatter_clicked()
-        self.pushButton_Close1stLid_clicked()
+        self.run_recipe("cook_1st_stove")
 
     def cook_2nd_stove(self):
-        self.pushButton_Grab2ndBatter_clicked()
-        self.pushButton_Pour2ndBatter_clicked()
-        self.pushButton_Drop2ndBatter_clicked
-        self.pushButton_Close2ndLid_clicked()
+        self.run_recipe("cook_2nd_stove")
 
     def serve_1st_stove(self):
-        self.pushButton_Open1stLid_clicked()
-        self.pushButton_GrabFork_clicked()
-        self.pushButton_Get1stWaffle_clicked()
-        self.pushButton_DropWaffle_clicked()
-        self.pushButton_DropFork_clicked()
+        self.run_recipe("serve_1st_stove")
 
     def serve_2nd_stove(self):
-        self.pushButton_Open2ndLid_clicked()
-        self.pushButton_GrabFork_clicked()
-        self.pushButton_Get2ndWaffle_clicked()
-        self.pushButton_DropWaffle_clicked()
-        self.pushButton_DropFork_clicked()
+        self.run_recipe("serve_2nd_stove")
+
+    def run_recipe(self, recipe):
+        try:
+            names = self.recipes[recipe]
+            if self.grabbing_spoon == True:
+                self.drop_spoon()
+
+            self.run_trajectory(names)
+            report = self.trajectories.chain_report(names)
+            if report is not None:
+                self.ui.textEdit_status.append(f"{recipe}: chained {len(names)} trajectories, expected to save {report['estimated_saving_s']:.1f} s.\n")
+        except Exception as e:
+            self.ui.textEdit_status.append(f"{recipe} error: {e}\n")
 
     #endregion
 
@@ -766,41 +818,19 @@ class main_window_ctrl(QMainWindow):
             self.ui.textEdit_status.append(f"Spoon peanuts error: {e}.\n") 
     #endregion
 
-    def run_trajectory(self, filename):
-        try:
-            # load nodes
-            nodes = load_trajectory_from_csv(filename)
-            parsed_nodes = []
-            print("Number of nodes:", len(nodes))
-            last_is_move = False
-            for i, node in enumerate(nodes):
-                if node.mode == Mode.MOVE:
-                    if last_is_move:
-                        parsed_nodes[-1].joints_values.append(list(np.deg2rad(node.joint_value)))
-                    else:
-                        parsed_nodes.append(node)
-                        parsed_nodes[-1].joints_values.append(list(np.deg2rad(node.joint_value)))
-                        last_is_move = True
+    def run_trajectory(self, name, speed_factor=None):
+        try:
+            # plans are parsed, merged and converted to radian once by the trajectory library
+            # a list of names runs as one chained plan
+            plan = self.trajectories.get(name, speed_factor)
+            print("Number of steps:", len(plan))
+            for i in range(len(plan)):
+                if plan.is_arm(i):
+                    print("type: arm", "waypoints:", plan.num_waypoints(i))
                 else:
-                    last_is_move = False
-                    parsed_nodes.append(node)
-            nodes = parsed_nodes
-            # append positions
-            for node in nodes:
-                print("mode:", node.mode, "joint_value:", node.joint_value)
-                if node.mode == Mode.OPEN:
-                    # self.rosCommunication.open_gripper() 
-                    self.rosCommunication.send_data({"type": "gripper", "grip_type": "open", "wait_time": 3.0})
-                elif node.mode == Mode.CLOSE:
-                    # self.rosCommunication.close_gripper() 
-                    self.rosCommunication.send_data({"type": "gripper", "grip_type": "close", "wait_time": 1.5})
-                elif node.mode == Mode.HALF_OPEN:
-                    self.rosCommunication.send_data({"type": "gripper", "grip_type": "half_open", "wait_time": 1.5})
-                elif node.mode == Mode.CLOSE_TIGHT:
-                    self.rosCommunication.send_data({"type": "gripper", "grip_type": "close_tight", "wait_time": 1.5})
-                elif node.mode == Mode.MOVE:
-                    # self.rosCommunication.append_joints(node.joint_value, block=False)     
-                    self.rosCommunication.send_data({"type": "arm", "joints_values": node.joints_values, "wait_time": 0.0})
+                    print("type: gripper", "grip_type:", plan.grip_type(i))
+            # the whole plan goes out in one program message, the bridge acks every step
+            self.rosCommunication.run_plan(plan, on_progress=lambda ack: print(f"{name}: step {ack['step'] + 1}/{len(plan)} done"))
 
         except Exception as e:
             raise e   
@@ -810,6 +840,8 @@ class main_window_ctrl(QMainWindow):
 
         if order.peanuts_num > 0:
             seconds += self.time_peanut_spoon * order.peanuts_num
+            if self.grabbing_spoon == False:
+                seconds += self.time_peanut_grab_spoon
 
         if order.waffle_num > self.num_left_waffle:
             if order.waffle_num - self.num_left_waffle <= 4:
@@ -856,6 +888,11 @@ class main_window_ctrl(QMainWindow):
         except Exception as e:
             self.ui.textEdit_status.append(f"ros_destroy error: {e}\n")
 
+        try:
+            self.comm_loop.stop()
+        except Exception as e:
+            self.ui.textEdit_status.append(f"comm_loop.stop error: {e}\n")
+
         try:
             if self.tcp:
                 self.tcp.close()
@@ -3,23 +3,33 @@
 
 import rclpy
 from rclpy.node import Node
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
 from rclpy.qos import QoSProfile, ReliabilityPolicy, HistoryPolicy
 from sensor_msgs.msg import JointState
 from tm_msgs.msg import FeedbackState
-import math
 import time
 
+import numpy as np
+
 
 class SingleRobotStateCollector(Node):
 
-    def __init__(self, fps: int = 30):
+    def __init__(self, fps: int = 30, history_size: int = 256):
         super().__init__('single_robot_state_collector')
 
         self.interval = 1.0 / max(1, fps)
         self.last_emit = 0.0
 
-        self.joints_deg = None
+        # 最近 history_size 筆 joint 狀態 (deg) 與收到的時間，預先配置的 ring buffer，
+        # 第 k 筆存在 k % history_size；_count 為已寫入的筆數，寫完一整筆才加一
+        self._history = np.zeros((history_size, 6))
+        self._stamps = np.zeros(history_size)
+        self._count = 0
         self.io = [0, 0, 0]
+        # 收到新的 joints_deg 時呼叫 callback(joints_deg)
+        self._joint_listeners = []
+        # 狀態訂閱自成一組，MultiThreadedExecutor 下不會和送指令的 callback 搶同一個執行緒
+        self.state_group = MutuallyExclusiveCallbackGroup()
 
         qos_sensor = QoSProfile(
             reliability=ReliabilityPolicy.BEST_EFFORT,
@@ -32,7 +42,8 @@ class SingleRobotStateCollector(Node):
             JointState,
             '/joint_states',
             self._on_joint,
-            qos_sensor
+            qos_sensor,
+            callback_group=self.state_group
         )
 
         # 訂閱 feedback_states（取得 DO）
@@ -40,20 +51,69 @@ class SingleRobotStateCollector(Node):
             FeedbackState,
             '/feedback_states',
             self._on_fb,
-            10
+            10,
+            callback_group=self.state_group
         )
 
+    def add_joint_listener(self, callback):
+        """
+        每筆新的 joint 狀態都呼叫 callback(joints_deg)，跑在 executor 處理 /joint_states 的執行緒上。
+        joints_deg 是 ring buffer 裡的 view，只在 callback 期間有效，要保留請自行複製。
+        callback 要很快返回，送指令這類工作請排到自己的 callback group (例如 guard condition)，不要卡住收狀態。
+        """
+        self._joint_listeners.append(callback)
+
+    @property
+    def joints_deg(self):
+        """最新的關節角 (deg) 複本，還沒收到時為 None"""
+        count = self._count
+        if count == 0:
+            return None
+        return self._history[(count - 1) % len(self._stamps)].copy()
+
     def _on_joint(self, msg: JointState):
-        if not msg.position or len(msg.position) < 6:
+        if len(msg.position) < 6:
             return
 
-        j6 = msg.position[:6]  # rad
-        joints_deg = [round(math.degrees(j), 2) for j in j6]
+        # 直接寫進下一格，不另外建 list
+        row = self._history[self._count % len(self._stamps)]
+        row[:] = msg.position[:6]  # rad
+        np.degrees(row, out=row)
 
-        if all(j == 0.0 for j in joints_deg):
+        if np.abs(row).max() < 0.005:
             return
 
-        self.joints_deg = joints_deg
+        self._stamps[self._count % len(self._stamps)] = time.time()
+        self._count += 1
+        for callback in self._joint_listeners:
+            callback(row)
+
+    def joint_history(self, n: int = None):
+        """
+        最近 n 筆 (預設 ring buffer 能保證的全部) 的 (stamps, joints_deg) 複本，由舊到新。
+        不上鎖：複製期間 ring buffer 被寫入者追上時重新讀取。
+        """
+        size = len(self._stamps)
+        while True:
+            end = self._count
+            num = min(size - 1 if n is None else n, size - 1, end)
+            index = np.arange(end - num, end) % size
+            stamps = self._stamps[index]
+            joints = self._history[index]
+            # 寫入中的那一格是 self._count，還沒蓋到讀過的最舊一筆就是一致的
+            if self._count - end + num < size:
+                return stamps, joints
+
+    def joint_velocity_acceleration(self, n: int = 9):
+        """
+        最近 n 筆對時間做二次多項式擬合，回傳最新一筆時各軸的 (速度 deg/s, 加速度 deg/s^2)，
+        各軸一次算完；不足 3 筆時回傳 None。
+        """
+        stamps, joints = self.joint_history(n)
+        if len(stamps) < 3:
+            return None
+        coeffs = np.polyfit(stamps - stamps[-1], joints, 2)
+        return coeffs[1], 2.0 * coeffs[0]
 
     def _on_fb(self, msg: FeedbackState):
         ee = list(msg.ee_digital_output) if msg.ee_digital_output else []
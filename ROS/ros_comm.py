@@ -1,20 +1,242 @@
+import asyncio
+import logging
+from collections import deque
+
 from ROS.socket_communication import (
-    NonBlockingJSONSender,
-    BlockingJSONReceiver,
+    AsyncJSONClient,
+    EventLoopThread,
+    JSONCodec,
+    is_hello_reply,
+    make_codec,
 )
+from ROS.trajectory_estimator import APPROACH_BOUND_S, estimate_message, estimate_steps
 
-class ROSCommunication:
-    def __init__(self, port_sender=9893, port_receiver=9894):
-        self.sender = NonBlockingJSONSender(port=port_sender)
-        self.receiever = BlockingJSONReceiver(port=port_receiver)
+logger = logging.getLogger(__name__)
+
+# bridges that do not know the hello may never answer it
+HELLO_TIMEOUT_S = 2.0
+# a step that gets no reply within DEADLINE_FACTOR times its estimated duration plus
+# DEADLINE_SLACK_S fails with TimeoutError; messages without an estimate get DEFAULT_DEADLINE_S.
+# The pose the robot starts from is unknown (GraspGen moves it too), so the move to the first
+# point of a plan or arm message is estimated as APPROACH_BOUND_S
+DEADLINE_FACTOR = 2.0
+DEADLINE_SLACK_S = 3.0
+DEFAULT_DEADLINE_S = 10.0
+
+def _ends_program(message):
+    return not (isinstance(message, dict) and message.get("type") == "progress")
+
+class AsyncROSCommunication:
+    """
+    ROS bridge client on asyncio: every call returns an awaitable, so the orchestrator can
+    wait on the robot together with the wok and GraspGen. Call start() on the event loop
+    before anything else.
+    """
+
+    def __init__(self, port_sender=9893, port_receiver=9894, program_mode=False, codec="json", window=1,
+                 duplex=False, deadlines=True):
+        self.client = AsyncJSONClient(port_sender, port_receiver)
+        # send whole plans as one "program" message to bridges that say they run them in
+        # their hello reply; turned off automatically when the bridge answers a program
+        # without any progress ack. Off by default: only bridges that speak the hello
+        # should get one, older ones make every connect wait HELLO_TIMEOUT_S for nothing
+        self.program_mode = program_mode
+        # whether the bridge on the current sender connection accepted programs
+        self.programs = False
+        # codec offered to the bridge on every new connection: json, binary or binary32
+        self.codec = codec
+        # messages sent ahead of their replies when the bridge repeats request IDs, so the
+        # next step is queued on the bridge while the current one runs; 1 turns IDs off
+        self.window = window
+        # ask the bridge to reply on the sender connection, so it needs no connection back
+        self.duplex = duplex
+        # wait at most deadline(...) for each reply, False waits forever
+        self.deadlines = deadlines
+        self._codec_connection = None
+
+    async def start(self):
+        await self.client.start()
+
+    def deadline(self, seconds=None):
+        """Reply timeout of a message expected to take seconds, None for no timeout."""
+        if not self.deadlines:
+            return None
+        if seconds is None:
+            return DEFAULT_DEADLINE_S
+        return seconds * DEADLINE_FACTOR + DEADLINE_SLACK_S
+
+    async def _receive(self, request_id, timeout, what, last_reply=None):
+        """
+        The next reply to a request. On timeout the request is abandoned, so without request
+        IDs its late replies, up to the one last_reply(message) is true for, are dropped
+        instead of being taken for the replies of the next requests.
+        """
+        try:
+            return await self.client.receive_reply(request_id, timeout)
+        except asyncio.TimeoutError:
+            await self.client.abandon_request(request_id, last_reply)
+            raise TimeoutError(f"ROS bridge did not answer {what} within {timeout:.1f} s") from None
+
+    async def send_data(self, data, timeout=None):
+        """Sends one message and returns its reply; timeout defaults to the deadline of the message."""
+        await self.negotiate_codec()
+        if timeout is None:
+            timeout = self.deadline(estimate_message(data, APPROACH_BOUND_S))
+        request_id = await self.client.send_request(data)
+        try:
+            return await self._receive(request_id, timeout, "the message")
+        finally:
+            await self.client.close_request(request_id)
+
+    async def negotiate_codec(self):
+        """
+        Offers self.codec, request IDs, duplex and programs with
+        {"type": "hello", "codecs": [...], "ids": true, "duplex": true, "program": true} once per
+        sender connection. The sender switches only when the bridge answers {"type": "hello",
+        "codec": ..., "ids": true, "duplex": true, "program": true}; anything else keeps JSON
+        without IDs on two connections and one message per step. Bridges older than the hello
+        never answer it, so they get no program either: one they ignore would only end in a timeout.
+        """
+        if self.codec == "json" and self.window <= 1 and not self.duplex and not self.program_mode:
+            return
+        await self.client.ensure_connected()
+        if self._codec_connection == self.client.connection_id:
+            return
+        codec = make_codec(self.codec)
+        hello = {"type": "hello", "codecs": [codec.name] if codec.name == "json" else [codec.name, "json"]}
+        if self.window > 1:
+            hello["ids"] = True
+        if self.duplex:
+            hello["duplex"] = True
+        if self.program_mode:
+            hello["program"] = True
+        self._codec_connection = self.client.connection_id
+        self.programs = False
+        try:
+            # a late answer is dropped, anything else still goes to the requests after the hello
+            reply = await self.client.request(hello, HELLO_TIMEOUT_S, is_hello_reply, may_not_reply=True)
+        except asyncio.TimeoutError:
+            reply = None
+        if not is_hello_reply(reply):
+            logger.warning("ROS bridge did not answer the hello, sending JSON without request IDs")
+            return
+        if reply.get("codec") == codec.name:
+            self.client.codec = codec
+            logger.info(f"ROS bridge accepted the {self.codec} codec")
+        else:
+            logger.warning(f"ROS bridge did not accept the {self.codec} codec, sending JSON")
+        if self.window > 1 and reply.get("ids"):
+            self.client.ids = True
+            self.client.window = self.window
+            logger.info(f"ROS bridge repeats request IDs, up to {self.window} messages in flight")
+        if self.duplex and reply.get("duplex"):
+            self.client.duplex = True
+            logger.info("ROS bridge replies on the sender connection")
+        if self.program_mode and reply.get("program"):
+            self.programs = True
+            logger.info("ROS bridge runs program messages")
+
+    def _encode(self, plan, i=None):
+        """The program message (or step i) of a plan in the form the sender codec wants."""
+        if isinstance(self.client.codec, JSONCodec):
+            return plan.to_json() if i is None else plan.step_json(i)
+        return plan.to_message() if i is None else plan.step(i, arrays=True)
 
-    def send_data(self, data):
+    async def send_program(self, plan, on_progress=None):
+        """
+        Sends every step of a TrajectoryPlan in one {"type": "program"} frame. The bridge runs
+        them back to back and replies {"type": "progress", "step": i} after each step, then
+        {"type": "program_done"} or {"type": "program_error", "step": i, "error": ...}.
+        Every reply has to come within the deadline of the step it is waiting for.
+        Returns the final reply and the number of progress acks received.
+        """
+        step_seconds = estimate_steps(plan, approach_s=APPROACH_BOUND_S) if self.deadlines else [None] * len(plan)
+        await self.negotiate_codec()
+        request_id = await self.client.send_request(self._encode(plan))
         try:
-            self.sender.send_data(data)
-            return self.receiever.capture_data()
-        except Exception as e:
-            raise e
+            num_progress = 0
+            while True:
+                if num_progress < len(plan):
+                    timeout, what = self.deadline(step_seconds[num_progress]), f"step {num_progress}"
+                else:
+                    timeout, what = self.deadline(0.0), "the end of the program"
+                reply = await self._receive(request_id, timeout, what, _ends_program)
+                if isinstance(reply, dict) and reply.get("type") == "progress":
+                    num_progress += 1
+                    if on_progress is not None:
+                        on_progress(reply)
+                    continue
+                return reply, num_progress
+        finally:
+            await self.client.close_request(request_id)
+
+    async def run_plan(self, plan, on_progress=None):
+        """
+        Executes a TrajectoryPlan in one program message when the bridge accepted programs in
+        its hello reply, otherwise one message and one reply per step. on_progress is called
+        with the ack of every step.
+        """
+        await self.negotiate_codec()
+        if self.program_mode and self.programs:
+            reply, num_progress = await self.send_program(plan, on_progress)
+            if isinstance(reply, dict) and reply.get("type") == "program_done":
+                return reply
+            if num_progress > 0 or (isinstance(reply, dict) and reply.get("type") == "program_error"):
+                raise RuntimeError(f"Program stopped after {num_progress} of {len(plan)} steps: {reply}")
+            logger.warning("ROS bridge does not support program messages, sending one message per step")
+            self.program_mode = False
+            self.programs = False
+
+        # steps go out while earlier ones still run, as far as the in-flight window allows
+        step_seconds = estimate_steps(plan, approach_s=APPROACH_BOUND_S) if self.deadlines else [None] * len(plan)
+        in_flight = deque()
+        reply = None
+        for i in range(len(plan)):
+            if len(in_flight) >= self.client.in_flight_limit():
+                reply = await self._finish_step(*in_flight.popleft(), step_seconds, on_progress)
+            await self.negotiate_codec()
+            in_flight.append((i, await self.client.send_request(self._encode(plan, i))))
+        while in_flight:
+            reply = await self._finish_step(*in_flight.popleft(), step_seconds, on_progress)
+        return reply
+
+    async def _finish_step(self, i, request_id, step_seconds, on_progress):
+        try:
+            reply = await self._receive(request_id, self.deadline(step_seconds[i]), f"step {i}")
+        finally:
+            await self.client.close_request(request_id)
+        if on_progress is not None:
+            on_progress({"type": "progress", "step": i, "reply": reply})
+        return reply
+
+    async def quit(self):
+        await self.client.disconnect()
+
+class ROSCommunication:
+    """
+    Blocking front end of AsyncROSCommunication. Pass the same loop_thread to several
+    clients to run them on one event loop; submit() hands back a concurrent Future for
+    callers that want to wait on several of them at once.
+    """
+
+    def __init__(self, port_sender=9893, port_receiver=9894, program_mode=False, codec="json", window=1,
+                 duplex=False, deadlines=True, loop_thread=None):
+        self._owns_loop = loop_thread is None
+        self.loop_thread = EventLoopThread() if loop_thread is None else loop_thread
+        self.comm = AsyncROSCommunication(port_sender, port_receiver, program_mode, codec, window, duplex,
+                                          deadlines)
+        self.loop_thread.run(self.comm.start())
+
+    def submit(self, coro):
+        return self.loop_thread.submit(coro)
+
+    def send_data(self, data, timeout=None):
+        return self.loop_thread.run(self.comm.send_data(data, timeout))
+
+    def run_plan(self, plan, on_progress=None):
+        return self.loop_thread.run(self.comm.run_plan(plan, on_progress))
 
     def quit(self):
-        self.sender.disconnect()
-        self.receiever.disconnect()
\ No newline at end of file
+        self.loop_thread.run(self.comm.quit())
+        if self._owns_loop:
+            self.loop_thread.stop()
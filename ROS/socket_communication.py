@@ -1,8 +1,12 @@
+import asyncio
 import socket
 import json
 import logging
 import struct
-import select
+import threading
+from collections import OrderedDict
+
+import numpy as np
 # Some example joint configurations to send
 
 logger = logging.getLogger(__name__)
@@ -33,296 +37,449 @@ SAMPLE_DATA = {
 }
 
 
-class NonBlockingJSONSender:
+# A frame is a 4 byte big endian length followed by the payload. Frames with this bit
+# set in the length start with one codec tag byte, plain frames are JSON as before.
+TAGGED_FRAME = 0x80000000
+# Tag bytes with this bit set are followed by a 4 byte big endian request ID, which the
+# peer repeats on every reply to that request. Only sent once the peer agreed in its hello.
+FRAME_HAS_ID = 0x80
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JSONCodec:
     """
-    A class to manage connection and sending goals to the robot bridge.
-    Connects automatically upon instantiation.
+    Plain JSON frames, understood by every peer. numpy arrays are sent as lists.
     """
 
-    def __init__(self, port, host="localhost"):
-        self.host = host
-        self.port = port
-        self.socket = None
-        self._connect_on_init()  # Attempt connection during initialization
+    name = "json"
+    tag = 0
 
-    def _connect_on_init(self):
-        """
-        Internal method to establish connection. Used during init and for re-connection.
-        Returns True on success, False otherwise.
-        """
-        if self.socket:
-            # Already connected or socket object exists, close it first to ensure a fresh connection
-            self.disconnect()
+    def encode(self, data) -> bytes:
+        return json.dumps(data, default=_json_default).encode("utf-8")
 
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            logger.info(f"Sender connected to receiver at {self.host}:{self.port}")
-            return True
-        except ConnectionRefusedError:
-            logger.warning(f"No socket currently listening at {self.host}:{self.port}")
-            self.socket = None
-            return False
-        except Exception as e:
-            logger.exception(f"An error occurred during connection: {e}")
-            self.socket = None
-            return False
+    def decode(self, payload):
+        return json.loads(str(payload, "utf-8"))
 
-    def disconnect(self):
-        """
-        Closes the connection to the robot bridge.
-        """
-        if self.socket:
-            self.socket.close()
-            self.socket = None
-            logger.info("Sender disconnected")
 
-    def reconnect(self) -> bool:
-        """
-        Closes the current connection and establishes a new one.
-        """
-        logger.info("Attempting to reconnect sender...")
-        self.disconnect()
-        return self._connect_on_init()
+class BinaryCodec:
+    """
+    A JSON header in which every numpy array is replaced by {"__array__": dtype, "shape": ...},
+    followed by the raw little endian bytes of the arrays in the order they appear.
+    With float32, float64 arrays are sent as float32. Decoded arrays are copies.
+    """
 
-    def send_data(self, data: dict) -> bool:
-        """
-        Sends a single joint position goal to the robot bridge.
-        Attempts to reconnect if the connection is lost.
-        Returns True on successful send, False otherwise.
-        """
-        if not self.socket:
-            logger.info("Connection not established. Attempting to reconnect.")
-            if not self.reconnect():
-                return False
+    name = "binary"
+    tag = 1
 
-        # Check if the socket is still alive before sending
-        try:
-            ready_to_read, _, _ = select.select([self.socket], [], [], 0)
-            if ready_to_read:
-                # If the socket is readable, it might be closed.
-                # A recv with MSG_PEEK will not remove data from buffer.
-                # If it returns b'', the peer has closed the connection.
-                if self.socket.recv(1, socket.MSG_PEEK) == b"":
-                    logger.warning("The other peer's receiver has disconnected.")
-                    raise BrokenPipeError("Connection closed by peer")
-        except BrokenPipeError:
-            logger.info("Connection lost. Attempting to reconnect and resend.")
-            if self.reconnect():
-                return self.send_data(data)  # Retry sending
-            else:
-                return False
-        except Exception as e:
-            logger.exception(f"An error occurred while checking socket status: {e}")
-            return False
+    def __init__(self, float32=False):
+        self.float32 = float32
 
-        if not (isinstance(data, dict) or isinstance(data, list)):
-            logger.error("data is not a dict or a list")
-            return False
+    def encode(self, data) -> bytes:
+        arrays = []
 
-        message_bytes = json.dumps(data).encode("utf-8")
-        header = struct.pack(">I", len(message_bytes))
+        def strip(value):
+            if isinstance(value, np.ndarray):
+                if self.float32 and value.dtype == np.float64:
+                    value = value.astype(np.float32)
+                value = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+                arrays.append(value)
+                return {"__array__": value.dtype.str, "shape": list(value.shape)}
+            if isinstance(value, dict):
+                return {key: strip(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [strip(item) for item in value]
+            return value
 
-        try:
-            logger.debug(f"Sending signal: {data}")
-            self.socket.sendall(header + message_bytes)
-            logger.info("Sent!")
-            return True
-        except BrokenPipeError:
-            logger.warning("Connection lost while sending. Attempting to reconnect.")
-            if self.reconnect():  # Try to reconnect
-                return self.send_data(data)  # Retry sending
-            return False
-        except Exception as e:
-            logger.exception(f"An error occurred while sending: {e}")
-            return False
+        header = json.dumps(strip(data), default=_json_default).encode("utf-8")
+        return b"".join([struct.pack(">I", len(header)), header] + [array.data for array in arrays])
+
+    def decode(self, payload):
+        header_len = struct.unpack_from(">I", payload, 0)[0]
+        offset = 4 + header_len
+
+        def restore(value):
+            nonlocal offset
+            if isinstance(value, dict):
+                if "__array__" in value:
+                    dtype = np.dtype(value["__array__"])
+                    count = int(np.prod(value["shape"]))
+                    array = np.frombuffer(payload, dtype, count, offset).reshape(value["shape"]).copy()
+                    offset += count * dtype.itemsize
+                    return array
+                return {key: restore(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [restore(item) for item in value]
+            return value
 
+        return restore(json.loads(str(payload[4:offset], "utf-8")))
 
-class NonBlockingJSONReceiver:
+
+CODECS = {"json": JSONCodec, "binary": BinaryCodec}
+_CODECS_BY_TAG = {JSONCodec.tag: JSONCodec(), BinaryCodec.tag: BinaryCodec()}
+
+
+def make_codec(name):
+    """json, binary, or binary32 for the binary codec sending float64 arrays as float32."""
+    if name == "binary32":
+        return BinaryCodec(float32=True)
+    return CODECS[name]()
+
+
+def codec_hello_reply(hello, supported=("binary", "json"), ids=True, duplex=True, program=True):
     """
-    A class to manage connection and receive dict.
-    Connects automatically upon instantiation.
+    The reply of a bridge to {"type": "hello", "codecs": [...], "ids": true, "duplex": true, "program": true}:
+    the first offered codec it supports, whether it repeats request IDs on its replies,
+    whether it replies on the connection the hello came in on and whether it runs
+    {"type": "program"} messages. A duplex bridge sends this reply on that connection
+    already. The sender switches only after this reply.
     """
+    reply = {"type": "hello", "codec": "json"}
+    for name in hello.get("codecs", []):
+        if name in supported:
+            reply["codec"] = name
+            break
+    if ids and hello.get("ids"):
+        reply["ids"] = True
+    if duplex and hello.get("duplex"):
+        reply["duplex"] = True
+    if program and hello.get("program"):
+        reply["program"] = True
+    return reply
+
+
+def is_hello_reply(message) -> bool:
+    """Whether message is a peer's answer to a hello, the last_reply of an abandoned hello."""
+    return isinstance(message, dict) and message.get("type") == "hello"
+
+
+def encode_frame(data, codec, request_id=None) -> bytes:
+    """Length prefixed frame of data; str / bytes are sent as already encoded JSON."""
+    if isinstance(data, bytes):
+        payload, tag = data, JSONCodec.tag
+    elif isinstance(data, str):
+        payload, tag = data.encode("utf-8"), JSONCodec.tag
+    else:
+        payload, tag = codec.encode(data), codec.tag
+    if request_id is not None:
+        return struct.pack(">IBI", (len(payload) + 5) | TAGGED_FRAME, tag | FRAME_HAS_ID, request_id) + payload
+    if tag == JSONCodec.tag:
+        return struct.pack(">I", len(payload)) + payload
+    return struct.pack(">IB", (len(payload) + 1) | TAGGED_FRAME, tag) + payload
+
+
+def frame_length(header) -> int:
+    """Payload length of a frame from its 4 byte length header value."""
+    return header & ~TAGGED_FRAME
+
+
+def decode_frame(header, payload):
+    """
+    Decodes the payload of a frame, picking the codec from the header and the tag byte.
+    Returns the request ID of the frame, None if it has none, and the message.
+    """
+    if not header & TAGGED_FRAME:
+        return None, json.loads(str(payload, "utf-8"))
+    tag = payload[0]
+    if tag & FRAME_HAS_ID:
+        request_id = struct.unpack_from(">I", payload, 1)[0]
+        return request_id, _CODECS_BY_TAG[tag & ~FRAME_HAS_ID].decode(payload[5:])
+    return None, _CODECS_BY_TAG[tag].decode(payload[1:])
 
-    def __init__(self, port, host="localhost"):
-        self.host = host
-        self.port = port
-        self.socket = None
-        self.conn = None
-        self.buffer = b""
-        self.msg_len = None
-        self._connect_on_init()  # Attempt connection during initialization
-
-    def _connect_on_init(self):
-        """
-        Internal method to establish connection. Used during init and for re-connection.
-        Returns True on success, False otherwise.
-        """
-        if self.socket:
-            # Already connected or socket object exists, close it first to ensure a fresh connection
-            self.disconnect()
 
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket.setblocking(False)
-            self.socket.bind((self.host, self.port))
-            self.socket.listen()
-
-            self.conn = None
-            logger.info(f"Receiver starts listening at {self.host}:{self.port}")
-            return True
-        except ConnectionRefusedError:
-            logger.exception("Receiver connection failed.")
-            self.socket = None
-            return False
-        except Exception as e:
-            logger.exception(f"An error occurred during connection: {e}")
-            self.socket = None
-            return False
+def decode_payload(header, payload):
+    """The message of a frame, see decode_frame."""
+    return decode_frame(header, payload)[1]
 
-    def disconnect(self):
-        if self.socket:
-            self.socket.close()
-            self.socket = None
-            logger.info("receiver disconnected")
 
-    def capture_data(self):
-        try:
-            if self.conn is None:
-                self.conn, addr = self.socket.accept()
-                self.conn.setblocking(False)
-                self.buffer = b""
-                self.msg_len = None
-                logger.info(f"Accepted connection from {addr}")
-            while True:
-                data = self.conn.recv(4096)
-                if not data:
-                    logger.warning("The other peer's sender has disconnected.")
-                    self.conn.close()
-                    self.conn = None
-                    return None
-                self.buffer += data
-        except BlockingIOError:
-            pass  # No data available
-        except Exception as e:
-            logger.exception(f"Socket server error on recv: {e}")
-            if self.conn:
-                self.conn.close()
-            self.conn = None
-            return None
-
-        # Process buffer for a complete message
-        if self.msg_len is None:
-            if len(self.buffer) >= 4:
-                self.msg_len = struct.unpack(">I", self.buffer[:4])[0]
-                self.buffer = self.buffer[4:]
-            else:
-                return None  # Not enough data for header
-        # check message length
-        if len(self.buffer) < self.msg_len:
-            raise ValueError(
-                "Message length defined in the header is larger than the received buffer size, shouldn't happen"
-            )
-
-        message_bytes = self.buffer[: self.msg_len]
-        self.buffer = self.buffer[self.msg_len :]
-        self.msg_len = None  # Reset for next message
-        try:
-            return json.loads(message_bytes.decode("utf-8"))
-        except json.JSONDecodeError as e:
-            logger.exception(f"JSON decode error: {e}")
-            return None
+class EventLoopThread:
+    """
+    An asyncio event loop running in a daemon thread, shared by the synchronous wrappers
+    of the async clients. submit() returns a concurrent.futures.Future, run() waits for it.
+    """
+
+    def __init__(self, name="socket-communication-loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
 
 
-class BlockingJSONReceiver:
+class AsyncJSONClient:
     """
-    A class to manage connection and receive dict.
-    Connects automatically upon instantiation.
+    Socket client of the ROS bridge and the GraspGen server on an asyncio event loop:
+    connects to the peer's receiver at port_sender, and listens at port_receiver for
+    the peer to connect and send its replies. A duplex peer (see codec_hello_reply) replies
+    on the sender connection instead and never connects back; both are read alike.
+
+    send_request() sends a message under a new request ID and returns the ID; its replies
+    are then awaited with receive_reply() until close_request(). Once the peer agreed to
+    repeat IDs (ids = True) up to window requests are in flight and replies are matched
+    by ID, otherwise one request at a time gets every reply, as before. Replies without
+    an ID go to the oldest open request, messages nobody waits for to capture_data().
+    A request given up with abandon_request() keeps its place in that order until its
+    late replies came in, so they do not end up at the requests sent after it.
+    Both the ROS bridge and the GraspGen server clients are built on this class.
     """
 
-    def __init__(self, port, host="localhost"):
+    def __init__(self, port_sender, port_receiver, host="localhost", max_retries=3, retry_delay=0.1):
         self.host = host
-        self.port = port
-        self.socket = None
-        self.conn = None
-        self._connect_on_init()  # Attempt connection during initialization
-
-    def _connect_on_init(self):
-        """
-        Internal method to establish connection. Used during init and for re-connection.
-        Returns True on success, False otherwise.
-        """
-        if self.socket:
-            # Already connected or socket object exists, close it first to ensure a fresh connection
-            self.disconnect()
-
+        self.port_sender = port_sender
+        self.port_receiver = port_receiver
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # codec of dict / list payloads, back to JSON on every new connection until
+        # the peer agreed to another one; connection_id counts the connections
+        self.codec = JSONCodec()
+        self.connection_id = 0
+        # set by the owner when the peer agreed to reply on the sender connection,
+        # back to False on every new connection
+        self.duplex = False
+        self._writer = None
+        self._server = None
+        self._replies = None
+        # set by the owner after the peer's hello, back to False on every new connection
+        self.ids = False
+        self.window = 1
+        self._next_id = 0
+        # request ID -> queue of its replies, in the order the requests were sent
+        self._pending = OrderedDict()
+        # abandoned request ID -> (last_reply(message), may_not_reply), see abandon_request
+        self._abandoned = {}
+        self._slots = None
+        # peer handlers and sender watchers with their connection, closed on disconnect
+        self._tasks = {}
+
+    async def start(self):
+        """Starts listening for the peer and connects to it, a failed connect is retried on send."""
+        self._replies = asyncio.Queue()
+        self._slots = asyncio.Condition()
+        self._server = await asyncio.start_server(
+            self._handle_peer, self.host, self.port_receiver, reuse_address=True
+        )
+        logger.info(f"Receiver starts listening at {self.host}:{self.port_receiver}")
+        await self.connect()
+
+    async def connect(self) -> bool:
+        self._close_writer()
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket.bind((self.host, self.port))
-            self.socket.listen()
-
-            self.conn = None
-            logger.info(f"Receiver starts listening at {self.host}:{self.port}")
-            return True
+            reader, writer = await asyncio.open_connection(self.host, self.port_sender)
         except ConnectionRefusedError:
-            logger.exception("Receiver connection failed.")
-            self.socket = None
+            logger.warning(f"No socket currently listening at {self.host}:{self.port_sender}")
             return False
-        except Exception as e:
+        except OSError as e:
             logger.exception(f"An error occurred during connection: {e}")
-            self.socket = None
             return False
-
-    def disconnect(self):
-        if self.socket:
-            self.socket.close()
-            self.socket = None
-            logger.info("receiver disconnected")
-
-    def _read_blocking(self, n):
-        """Helper to read exactly n bytes from a blocking socket."""
-        data = b""
-        while len(data) < n:
-            packet = self.conn.recv(n - len(data))
-            if not packet:
-                return None
-            data += packet
-        return data
-
-    def capture_data(self):
+        sock = writer.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._writer = writer
+        self.codec = JSONCodec()
+        self.ids = False
+        self.duplex = False
+        self.connection_id += 1
+        # duplex peers reply on this connection, the others never write on it and EOF
+        # just means they went away
+        asyncio.ensure_future(self._read_replies(reader, writer))
+        logger.info(f"Sender connected to receiver at {self.host}:{self.port_sender}")
+        return True
+
+    async def ensure_connected(self) -> bool:
+        """Connects now if needed, so a hello goes out before the first message of a new connection."""
+        return self._writer is not None or await self.connect()
+
+    async def _read_replies(self, reader, writer):
+        self._tasks[asyncio.current_task()] = writer
         try:
-            if self.conn is None:
-                self.conn, addr = self.socket.accept()
-                logger.info(f"Accepted connection from {addr}")
-
-            header_data = self._read_blocking(4)
-            if not header_data:
-                logger.warning("Sender disconnected. Re-accepting... ")
-                self.conn.close()
-                self.conn = None
-                return self.capture_data()  # Wait for new connection
-
-            msg_len = struct.unpack(">I", header_data)[0]
-
-            message_bytes = self._read_blocking(msg_len)
-            if not message_bytes:
-                logger.warning("Sender disconnected. Re-accepting... ")
-                self.conn.close()
-                self.conn = None
-                return self.capture_data()  # Wait for new connection
-
-            return json.loads(message_bytes.decode("utf-8"))
-        except (json.JSONDecodeError, struct.error) as e:
-            logger.exception(f"Data format error: {e}")
-            if self.conn:
-                self.conn.close()
-            self.conn = None
-            return None
-        except Exception as e:
+            await self._read_frames(reader)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            self._tasks.pop(asyncio.current_task(), None)
+        if self._writer is writer:
+            logger.warning("The other peer's receiver has disconnected.")
+            self._close_writer()
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _handle_peer(self, reader, writer):
+        self._tasks[asyncio.current_task()] = writer
+        logger.info(f"Accepted connection from {writer.get_extra_info('peername')}")
+        try:
+            await self._read_frames(reader)
+        except asyncio.IncompleteReadError:
+            logger.warning("Sender disconnected. Waiting for a new connection...")
+        except OSError as e:
             logger.exception(f"Socket server error: {e}")
-            if self.conn:
-                self.conn.close()
-            self.conn = None
-            return None
+        finally:
+            self._tasks.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _read_frames(self, reader):
+        """Hands every frame from reader to _dispatch, until EOF raises IncompleteReadError."""
+        while True:
+            header = struct.unpack(">I", await reader.readexactly(4))[0]
+            payload = await reader.readexactly(frame_length(header))
+            try:
+                request_id, message = decode_frame(header, payload)
+            except (KeyError, ValueError, struct.error) as e:
+                logger.exception(f"Data format error: {e}")
+                continue
+            self._dispatch(request_id, message)
+
+    def _oldest_request(self, message):
+        """
+        The open request a reply without an ID belongs to: the oldest one, passing over
+        abandoned requests that may never be answered and that message is no reply to.
+        """
+        for request_id in self._pending:
+            abandoned = self._abandoned.get(request_id)
+            if abandoned is None or not abandoned[1] or abandoned[0](message):
+                return request_id
+        return None
+
+    def _dispatch(self, request_id, message):
+        if request_id is None:
+            request_id = self._oldest_request(message)
+        abandoned = self._abandoned.get(request_id)
+        if abandoned is not None:
+            logger.warning("Dropping a late reply to request %s: %s", request_id, message)
+            if abandoned[0](message):
+                del self._abandoned[request_id]
+                self._pending.pop(request_id, None)
+                asyncio.ensure_future(self._notify_slots())
+            return
+        replies = self._pending.get(request_id)
+        if replies is None:
+            logger.debug("Message for no open request: %s", message)
+            replies = self._replies
+        replies.put_nowait(message)
+
+    async def send_data(self, data, request_id=None) -> bool:
+        """
+        Sends data, a dict or a list encoded with self.codec or a str / bytes that is already
+        JSON encoded, with request_id in the frame header while ids is on. Reconnects and
+        resends up to max_retries times, waiting retry_delay, 2 * retry_delay, ... in between.
+        Returns True on successful send, False otherwise.
+        """
+        if not isinstance(data, (dict, list, str, bytes)):
+            logger.error("data is not a dict, a list or encoded JSON")
+            return False
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(delay)
+                delay *= 2
+            if self._writer is None and not await self.connect():
+                continue
+            try:
+                logger.debug("Sending signal: %s", data)
+                self._writer.write(encode_frame(data, self.codec, request_id if self.ids else None))
+                await self._writer.drain()
+                return True
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"Connection lost while sending: {e}. Attempting to reconnect.")
+                self._close_writer()
+        logger.error(f"Failed to send after {self.max_retries + 1} attempts")
+        return False
+
+    async def capture_data(self, timeout=None):
+        """Awaits the next message from the peer; raises asyncio.TimeoutError after timeout seconds."""
+        return await asyncio.wait_for(self._replies.get(), timeout)
+
+    def in_flight_limit(self) -> int:
+        return self.window if self.ids else 1
+
+    async def _notify_slots(self):
+        async with self._slots:
+            self._slots.notify_all()
+
+    async def send_request(self, data) -> int:
+        """Sends data once fewer than in_flight_limit() requests are open and returns its request ID."""
+        async with self._slots:
+            await self._slots.wait_for(
+                lambda: len(self._pending) - len(self._abandoned) < self.in_flight_limit())
+            request_id = self._next_id
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            self._pending[request_id] = asyncio.Queue()
+        if not await self.send_data(data, request_id):
+            await self.close_request(request_id)
+            raise ConnectionError(f"Failed to send to {self.host}:{self.port_sender}")
+        return request_id
+
+    async def receive_reply(self, request_id, timeout=None):
+        """Awaits the next reply to an open request; raises asyncio.TimeoutError after timeout seconds."""
+        return await asyncio.wait_for(self._pending[request_id].get(), timeout)
+
+    async def close_request(self, request_id):
+        """
+        Frees the slot of a request, later replies to it go to capture_data(). An abandoned
+        request stays open until its last reply, see abandon_request.
+        """
+        async with self._slots:
+            if request_id not in self._abandoned:
+                self._pending.pop(request_id, None)
+            self._slots.notify_all()
+
+    async def abandon_request(self, request_id, last_reply=None, may_not_reply=False):
+        """
+        Gives up on an open request whose replies may still come, e.g. after a timeout.
+        With request IDs late replies are told apart anyway and the request is closed.
+        Without them the request keeps its place as the oldest open request and its late
+        replies are dropped, up to and including the first one last_reply(message) is true
+        for (the first reply by default). It no longer counts against in_flight_limit().
+        may_not_reply is for requests a peer may ignore, like a hello to one that predates
+        it: then only messages last_reply is true for are taken for its late replies.
+        """
+        if self.ids:
+            await self.close_request(request_id)
+            return
+        if request_id in self._pending:
+            self._abandoned[request_id] = (last_reply or (lambda message: True), may_not_reply)
+            await self._notify_slots()
+
+    async def request(self, data, timeout=None, last_reply=None, may_not_reply=False):
+        """
+        Sends data and awaits its first reply. On timeout the request is abandoned with
+        last_reply and may_not_reply (see abandon_request) before asyncio.TimeoutError is raised.
+        """
+        request_id = await self.send_request(data)
+        try:
+            return await self.receive_reply(request_id, timeout)
+        except asyncio.TimeoutError:
+            await self.abandon_request(request_id, last_reply, may_not_reply)
+            raise
+        finally:
+            await self.close_request(request_id)
+
+    async def disconnect(self):
+        self._close_writer()
+        tasks = list(self._tasks)
+        for writer in self._tasks.values():
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("receiver disconnected")
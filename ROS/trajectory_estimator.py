@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+# execution model of TMRobotController, which takes its limits from here
+# joint commands closer than this to the previous one are not sent
+JOINT_DELTA_THRESHOLD_DEG = 4
+# TM5S joint speed limits (deg/s), 100% of the PTP velocity
+JOINT_MAX_SPEED_DEG_S = (180.0, 180.0, 180.0, 225.0, 225.0, 225.0)
+# append_joint defaults: velocity in % of JOINT_MAX_SPEED_DEG_S, ms to reach top speed
+PTP_VEL = 40
+PTP_ACC_MS = 20
+# the controller sends at most one queued command per interval
+MIN_SEND_INTERVAL_S = 0.2
+# SetIO calls plus the FeedbackState round trip before the gripper wait starts
+GRIPPER_SWITCH_S = 0.3
+
+def ptp_vel_for_duration(joint_from, joint_to, duration, min_vel=5, max_vel=100):
+    """PTP velocity in % that moves joint_from -> joint_to (degree) in duration seconds."""
+    if duration <= 0.0:
+        return int(max_vel)
+    ratio = max(
+        abs(float(b) - float(a)) / vmax
+        for a, b, vmax in zip(joint_from[:6], joint_to[:6], JOINT_MAX_SPEED_DEG_S)
+    ) / duration
+    return int(min(max_vel, max(min_vel, math.ceil(ratio * 100.0))))
+
+def ptp_duration(joint_from, joint_to, vel=PTP_VEL, acc=PTP_ACC_MS):
+    """
+    Seconds of a PTP move with a trapezoidal profile per joint: top speed is vel % of the
+    joint limit, reached in acc ms. The slowest joint sets the duration.
+    """
+    t_acc = acc / 1000.0
+    duration = 0.0
+    for a, b, vmax in zip(joint_from[:6], joint_to[:6], JOINT_MAX_SPEED_DEG_S):
+        distance = abs(float(b) - float(a))
+        v = vmax * vel / 100.0
+        if distance >= v * t_acc:
+            t = distance / v + t_acc
+        else:
+            t = 2.0 * math.sqrt(distance * t_acc / v)
+        duration = max(duration, t)
+    return duration
+
+# TM5S joint ranges (deg); no PTP move at PTP_VEL takes longer than the one that sweeps every
+# joint across its whole range, which bounds the move to a first point from an unknown pose
+JOINT_RANGE_DEG = (540.0, 360.0, 310.0, 360.0, 360.0, 540.0)
+APPROACH_BOUND_S = ptp_duration((0.0,) * 6, JOINT_RANGE_DEG)
+
+def estimate_arm_step(joints_deg, time_stamps=None, last_cmd=None, approach_s=0.0):
+    """
+    Seconds to run one arm segment the way TMRobotController.append_program queues it:
+    points closer than JOINT_DELTA_THRESHOLD_DEG to the previous command are skipped,
+    except the end point, and commands leave the queue every MIN_SEND_INTERVAL_S while
+    the robot works through them. With time_stamps every move gets the velocity that
+    matches the recorded timing. Without last_cmd the move to the first point takes
+    approach_s, e.g. APPROACH_BOUND_S for a deadline. Returns the duration and the last
+    commanded joints.
+    """
+    send_t = 0.0
+    finish_t = 0.0
+    last_t = None
+    last_index = len(joints_deg) - 1
+    for i, joints in enumerate(joints_deg):
+        if i != last_index and last_cmd is not None and \
+                max(abs(float(a) - float(b)) for a, b in zip(joints, last_cmd)) <= JOINT_DELTA_THRESHOLD_DEG:
+            continue
+        if last_cmd is None:
+            move = approach_s
+        elif time_stamps is None or last_t is None:
+            move = ptp_duration(last_cmd, joints)
+        else:
+            vel = ptp_vel_for_duration(last_cmd, joints, time_stamps[i] - last_t)
+            move = ptp_duration(last_cmd, joints, vel=vel)
+        finish_t = max(finish_t, send_t) + move
+        send_t += MIN_SEND_INTERVAL_S
+        last_cmd = joints
+        if time_stamps is not None:
+            last_t = time_stamps[i]
+    return finish_t, last_cmd
+
+def estimate_steps(plan, last_cmd=None, approach_s=0.0):
+    """
+    Expected seconds of every step of a TrajectoryPlan; last_cmd is the pose the robot starts
+    from (degree), without it the first move takes approach_s.
+    """
+    seconds = []
+    for i in range(len(plan)):
+        if plan.is_arm(i):
+            joints, time_stamps = plan.segment(i)
+            duration, last_cmd = estimate_arm_step(np.rad2deg(joints).tolist(),
+                                                   None if time_stamps is None else time_stamps.tolist(),
+                                                   last_cmd, approach_s)
+        else:
+            duration = GRIPPER_SWITCH_S
+        seconds.append(duration + float(plan.wait_times[i]))
+    return seconds
+
+def estimate_plan(plan, last_cmd=None):
+    """Expected seconds to execute a TrajectoryPlan; last_cmd is the pose the robot starts from (degree)."""
+    return sum(estimate_steps(plan, last_cmd))
+
+def estimate_message(message, approach_s=0.0):
+    """
+    Expected seconds of one arm or gripper message, None for other message types. The move
+    to the first point of an arm message takes approach_s.
+    """
+    if not isinstance(message, dict):
+        return None
+    if message.get("type") == "arm":
+        joints = np.rad2deg(np.asarray(message["joints_values"], dtype=float)).tolist()
+        return estimate_arm_step(joints, message.get("time_stamps"), approach_s=approach_s)[0]
+    if message.get("type") == "gripper":
+        return GRIPPER_SWITCH_S + float(message.get("wait_time", 0.0))
+    return None
@@ -0,0 +1,354 @@
+import glob
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ROS.trajectory_parser import (
+    RECORDED_FPS,
+    Mode,
+    classify_states,
+    load_trajectory_rows,
+    simplify_states,
+)
+from ROS.trajectory_estimator import estimate_plan
+
+logger = logging.getLogger(__name__)
+
+# gripper message and the seconds the bridge waits after switching the DO
+GRIPPER_COMMANDS = {
+    Mode.OPEN: ("open", 3.0),
+    Mode.CLOSE: ("close", 1.5),
+    Mode.HALF_OPEN: ("half_open", 1.5),
+    Mode.CLOSE_TIGHT: ("close_tight", 1.5),
+}
+
+# rough cost of every extra plan step on the bridge: the reply round trip and the
+# FeedbackState check before the next step goes out
+STEP_OVERHEAD_S = 0.5
+# joint speed assumed between two trajectories that do not meet, 40% (the default PTP
+# velocity of append_joint) of the 180 deg/s of the TM5S base joints
+JUNCTION_SPEED_DEG_S = 72.0
+
+def concat_rows(parts, dwell_tol_deg=0.5):
+    """
+    Concatenates the (states, modes, timestamps) rows of several trajectories into one.
+    A trajectory starting with the gripper command the previous one already ended in
+    loses that command, so the two arm segments become one. Where such a junction also
+    starts where the previous trajectory stopped (within dwell_tol_deg on every joint),
+    the standstill recorded at the end of the first and the start of the second
+    trajectory is cut out. Timestamps stay continuous across junctions.
+    No waypoints are added or moved, so the path through a junction is not blended;
+    only the steps and the dwell above go away.
+    Returns states, modes, timestamps and a report of what was removed.
+    """
+    report = {"junctions": len(parts) - 1, "gripper_steps_removed": 0, "gripper_wait_removed_s": 0.0,
+              "poses_merged": 0, "dwell_removed_s": 0.0}
+    states, modes, timestamps = (np.array(a, copy=True) for a in parts[0])
+    grip = _last_gripper_mode(modes)
+    for next_states, next_modes, next_timestamps in parts[1:]:
+        next_states, next_modes = np.array(next_states, copy=True), np.array(next_modes, copy=True)
+        next_timestamps = np.asarray(next_timestamps, dtype=np.float64)
+        next_grip = _last_gripper_mode(next_modes)
+        merge_poses = False
+        if grip is not None and len(next_modes) and next_modes[0] == grip:
+            next_modes[0] = Mode.MOVE.value
+            report["gripper_steps_removed"] += 1
+            report["gripper_wait_removed_s"] += GRIPPER_COMMANDS[Mode(grip)][1]
+            merge_poses = np.abs(states[-1, 0:6] - next_states[0, 0:6]).max() <= dwell_tol_deg
+
+        if merge_poses:
+            # keep the arrival of the first trajectory and the departure of the second
+            tail = _stationary_run(states[::-1, 0:6], modes[::-1], dwell_tol_deg)
+            head = _stationary_run(next_states[:, 0:6], next_modes, dwell_tol_deg)
+            arrival = len(states) - tail
+            report["dwell_removed_s"] += float((timestamps[-1] - timestamps[arrival])
+                                               + (next_timestamps[head - 1] - next_timestamps[0]))
+            report["poses_merged"] += 1
+            states, modes, timestamps = states[:arrival + 1], modes[:arrival + 1], timestamps[:arrival + 1]
+            next_states, next_modes = next_states[head:], next_modes[head:]
+            next_timestamps = next_timestamps[head:] - next_timestamps[head - 1] + timestamps[-1]
+        else:
+            gap = max(1.0 / RECORDED_FPS, np.abs(states[-1, 0:6] - next_states[0, 0:6]).max() / JUNCTION_SPEED_DEG_S)
+            next_timestamps = next_timestamps - next_timestamps[0] + timestamps[-1] + gap
+
+        states = np.concatenate([states, next_states])
+        modes = np.concatenate([modes, next_modes])
+        timestamps = np.concatenate([timestamps, next_timestamps])
+        grip = next_grip if next_grip is not None else grip
+    return states, modes, timestamps, report
+
+def _last_gripper_mode(modes):
+    gripper = np.flatnonzero(modes != Mode.MOVE.value)
+    return int(modes[gripper[-1]]) if len(gripper) else None
+
+def _stationary_run(joints, modes, tol_deg):
+    """Number of leading MOVE rows that stay within tol_deg of the first row, at least 1."""
+    moving = (np.abs(joints - joints[0]).max(axis=1) > tol_deg) | (modes != Mode.MOVE.value)
+    moving[0] = False
+    return int(np.argmax(moving)) if moving.any() else len(joints)
+
+class TrajectoryPlan:
+    """
+    The messages of one trajectory, backed by arrays instead of nested lists: the arm
+    waypoints of every step in one contiguous (M, 6) float64 array of radians, step i
+    owning rows offsets[i]:offsets[i + 1] (none for gripper steps). modes holds the Mode
+    value of every step, MOVE for arm steps. time_stamps, if recorded, holds the seconds of
+    every waypoint from the start of its segment, already divided by speed_factor.
+    """
+
+    __slots__ = ("joints", "time_stamps", "offsets", "modes", "wait_times", "speed_factor")
+
+    def __init__(self, joints, offsets, modes, wait_times, time_stamps=None, speed_factor=1.0):
+        self.joints = np.ascontiguousarray(joints, dtype=np.float64).reshape(-1, 6)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.modes = np.asarray(modes, dtype=np.int8)
+        self.wait_times = np.asarray(wait_times, dtype=np.float64)
+        self.time_stamps = None if time_stamps is None else np.ascontiguousarray(time_stamps, dtype=np.float64)
+        self.speed_factor = speed_factor
+
+    def __len__(self):
+        return len(self.modes)
+
+    def is_arm(self, i):
+        return self.modes[i] == Mode.MOVE.value
+
+    def grip_type(self, i):
+        return GRIPPER_COMMANDS[Mode(int(self.modes[i]))][0]
+
+    def num_waypoints(self, i):
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def segment(self, i):
+        """Joints (radian) and time stamps of arm step i, as views into the plan arrays."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.joints[start:end], None if self.time_stamps is None else self.time_stamps[start:end]
+
+    def step(self, i, arrays=False):
+        """
+        Step i as the dict sent to the bridge. With arrays, joints_values and time_stamps
+        are views into the plan arrays, for codecs that send arrays as they are.
+        """
+        if not self.is_arm(i):
+            return {"type": "gripper", "grip_type": self.grip_type(i), "wait_time": float(self.wait_times[i])}
+        joints, time_stamps = self.segment(i)
+        step = {"type": "arm", "joints_values": joints if arrays else joints.tolist(),
+                "wait_time": float(self.wait_times[i])}
+        if time_stamps is not None:
+            step["time_stamps"] = time_stamps if arrays else time_stamps.tolist()
+            step["speed_factor"] = self.speed_factor
+        return step
+
+    def step_json(self, i):
+        """
+        Step i encoded like json.dumps(self.step(i)), formatting the waypoints straight
+        from the flat array instead of building the nested lists.
+        """
+        if not self.is_arm(i):
+            return json.dumps(self.step(i))
+        joints, time_stamps = self.segment(i)
+        text = ('{"type": "arm", "joints_values": [' + _format_floats(joints.ravel(), 6)
+                + '], "wait_time": ' + repr(float(self.wait_times[i])))
+        if time_stamps is not None:
+            text += (', "time_stamps": [' + _format_floats(time_stamps, 1) + '], "speed_factor": '
+                     + json.dumps(self.speed_factor))
+        return text + "}"
+
+    def to_json(self):
+        """The whole plan as one program message, see ROSCommunication.send_program."""
+        return '{"type": "program", "steps": [' + ", ".join(self.step_json(i) for i in range(len(self))) + "]}"
+
+    def to_message(self):
+        """The program message with the waypoints as arrays, for the binary codec."""
+        return {"type": "program", "steps": [self.step(i, arrays=True) for i in range(len(self))]}
+
+def _format_floats(values, width):
+    """Formats a flat array like json.dumps, grouped into lists of width values when width > 1."""
+    if len(values) == 0:
+        return ""
+    item = ", ".join(["%r"] * width)
+    if width > 1:
+        item = "[" + item + "]"
+    return ", ".join([item] * (len(values) // width)) % tuple(values.tolist())
+
+# wait time of every Mode value, 0 for MOVE
+_wait_times = np.zeros(max(mode.value for mode in Mode) + 1)
+for _mode, (_, _wait_time) in GRIPPER_COMMANDS.items():
+    _wait_times[_mode.value] = _wait_time
+
+def build_plan(states, modes, timestamps=None, speed_factor=1.0):
+    """
+    Turns the rows of a trajectory into a TrajectoryPlan: every run of MOVE rows becomes
+    one arm step with the joints in radian, every gripper transition one gripper step.
+    With timestamps, arm steps also carry the recorded time of every waypoint in seconds
+    from the start of the segment, divided by speed_factor.
+    """
+    if speed_factor <= 0:
+        raise ValueError(f"speed_factor must be positive, got {speed_factor}")
+    modes = np.asarray(modes)
+    is_move = modes == Mode.MOVE.value
+    # a step starts at every gripper row and at every MOVE row after a gripper row
+    starts = np.flatnonzero(~is_move | np.r_[True, ~is_move[:-1]])
+    lengths = np.diff(np.r_[starts, len(modes)])
+    step_modes = modes[starts]
+    arm_lengths = np.where(step_modes == Mode.MOVE.value, lengths, 0)
+    offsets = np.r_[0, np.cumsum(arm_lengths)]
+    joints = np.deg2rad(np.asarray(states)[is_move, 0:6])
+    time_stamps = None
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        time_stamps = (timestamps[is_move] - np.repeat(timestamps[starts], arm_lengths)) / speed_factor
+    return TrajectoryPlan(joints, offsets, step_modes, _wait_times[step_modes], time_stamps, speed_factor)
+
+class TrajectoryLibrary:
+    """
+    Index of the trajectory csv files in a directory, keyed by file name without extension.
+    Plans are loaded on first use and kept in a bounded LRU, so the serving path only does
+    a dict lookup. speed_factor replays every demo faster (> 1) or slower (< 1) than it was
+    recorded, speed_factors overrides it per trajectory name. A list of names is a chain,
+    compiled into one plan by concat_rows.
+    """
+
+    def __init__(self, directory="ROS/trajectories", max_loaded=32, tolerance_deg=None,
+                 speed_factor=1.0, speed_factors=None):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.tolerance_deg = tolerance_deg
+        self.speed_factor = speed_factor
+        self.speed_factors = dict(speed_factors or {})
+        self.paths = {}
+        self.chain_reports = {}
+        self._plans = OrderedDict()
+        self._durations = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Re-scans the directory and drops every loaded plan."""
+        paths = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.csv"))):
+            paths[os.path.splitext(os.path.basename(path))[0]] = path
+        with self._lock:
+            self.paths = paths
+            self._plans.clear()
+            self._durations.clear()
+            self.chain_reports.clear()
+        logger.info(f"Indexed {len(paths)} trajectories in {self.directory}")
+
+    def names(self):
+        return list(self.paths)
+
+    def resolve(self, name):
+        """
+        Accepts a trajectory name, a file name or a path like ROS/trajectories/get_spoon.csv,
+        or a list of them for a chain (returned as a tuple of names).
+        """
+        if isinstance(name, (list, tuple)):
+            names = tuple(self.resolve(n) for n in name)
+            return names[0] if len(names) == 1 else names
+        name = os.path.splitext(os.path.basename(name))[0]
+        if name not in self.paths:
+            raise KeyError(f"Unknown trajectory: {name}")
+        return name
+
+    def speed_factor_for(self, name):
+        if isinstance(name, tuple):
+            return min(self.speed_factor_for(n) for n in name)
+        return self.speed_factors.get(name, self.speed_factor)
+
+    def set_speed_factor(self, speed_factor, name=None):
+        """Changes the global speed factor, or the one of a single trajectory."""
+        if speed_factor <= 0:
+            raise ValueError(f"speed_factor must be positive, got {speed_factor}")
+        if name is None:
+            self.speed_factor = speed_factor
+        else:
+            self.speed_factors[self.resolve(name)] = speed_factor
+
+    def load_rows(self, name):
+        rows = load_trajectory_rows(self.paths[name])
+        states, timestamps = rows[:, 0:9], rows[:, 9]
+        return states, classify_states(states), timestamps
+
+    def load_plan(self, name, speed_factor=1.0):
+        if isinstance(name, tuple):
+            states, modes, timestamps, report = concat_rows([self.load_rows(n) for n in name])
+        else:
+            states, modes, timestamps = self.load_rows(name)
+        if self.tolerance_deg is not None:
+            keep = simplify_states(states, modes, self.tolerance_deg)
+            logger.info(f"{name}: simplification removed {len(keep) - np.count_nonzero(keep)} of {len(keep)} waypoints")
+            states, modes, timestamps = states[keep], modes[keep], timestamps[keep]
+        plan = build_plan(states, modes, timestamps, speed_factor)
+        if isinstance(name, tuple):
+            report["estimated_saving_s"] = self.estimate_chain_saving(name, plan, speed_factor)
+            with self._lock:
+                self.chain_reports[name] = report
+            logger.info(f"{' + '.join(name)}: {report}")
+        return plan
+
+    def get(self, name, speed_factor=None):
+        """
+        Returns the ready to send plan of a trajectory or a chain, loading it on first use.
+        speed_factor overrides the configured factor for this call.
+        """
+        name = self.resolve(name)
+        key = (name, self.speed_factor_for(name) if speed_factor is None else speed_factor)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+
+        plan = self.load_plan(*key)
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_loaded:
+                self._plans.popitem(last=False)
+        return plan
+
+    def estimate(self, name, speed_factor=None):
+        """Expected execution time in seconds of a trajectory or a chain, see estimate_plan."""
+        name = self.resolve(name)
+        key = (name, self.speed_factor_for(name) if speed_factor is None else speed_factor)
+        with self._lock:
+            seconds = self._durations.get(key)
+        if seconds is None:
+            seconds = estimate_plan(self.get(*key))
+            with self._lock:
+                self._durations[key] = seconds
+        return seconds
+
+    def chain_report(self, names):
+        """What concat_rows removed in the last compiled plan of a chain, None before its first use."""
+        names = self.resolve(names)
+        with self._lock:
+            return self.chain_reports.get(names)
+
+    def estimate_chain_saving(self, names, plan, speed_factor=1.0):
+        """
+        Seconds the chained plan is expected to save over running its trajectories one by
+        one: the difference of the estimated execution times (the dropped gripper waits and
+        dwell) plus STEP_OVERHEAD_S for every plan step that concat_rows removed. Nothing is
+        counted for the junction motion, which concat_rows leaves as recorded.
+        """
+        separate = [self.get(n, speed_factor) for n in names]
+        return (sum(estimate_plan(p) for p in separate) - estimate_plan(plan)
+                + (sum(len(p) for p in separate) - len(plan)) * STEP_OVERHEAD_S)
+
+    def invalidate(self, name=None):
+        """Drops one loaded plan, or all of them, e.g. after a csv was edited."""
+        with self._lock:
+            if name is None:
+                self._plans.clear()
+                self._durations.clear()
+            else:
+                name = self.resolve(name)
+                for cache in (self._plans, self._durations):
+                    for key in [key for key in cache
+                                if key[0] == name or (isinstance(key[0], tuple) and name in key[0])]:
+                        del cache[key]
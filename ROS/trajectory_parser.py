@@ -1,6 +1,17 @@
 import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import warnings
 from enum import Enum
 
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
 class Mode(Enum):
     MOVE = 1
     OPEN = 2
@@ -13,61 +24,261 @@ status_close = [1, 0, 0]
 status_half_open = [0, 1, 0]
 status_close_tight = [1, 1, 0]
 
+_gripper_statuses = np.array([status_open, status_close, status_half_open, status_close_tight], dtype=np.float64)
+_gripper_mode_values = np.array([Mode.OPEN.value, Mode.CLOSE.value, Mode.HALF_OPEN.value, Mode.CLOSE_TIGHT.value], dtype=np.int8)
+
+# compiled trajectories are stored next to the csv files, e.g. ROS/trajectories/.cache/
+CACHE_DIR_NAME = ".cache"
+CACHE_VERSION = 3
+# sample rate of the recorded demos, used when a csv has no timestamp column
+RECORDED_FPS = 30
+
+# path -> (mtime_ns, size, delimiter, rows) of the trajectories compiled/mapped by this process
+_loaded_rows = {}
+
 class Movement:
     def __init__(self, mode, joint_value = None):
         self.mode = mode
         self.joints_values = []
         self.joint_value = joint_value
 
-def load_trajectory_from_csv(filename, delimiter=','):
+def _cache_paths(filename):
+    abspath = os.path.abspath(filename)
+    cache_dir = os.path.join(os.path.dirname(abspath), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(abspath))[0]
+    key = hashlib.sha1(abspath.encode("utf-8")).hexdigest()[:12]
+    base = os.path.join(cache_dir, f"{stem}-{key}")
+    return cache_dir, base + ".npy", base + ".json"
+
+def _read_cache_meta(meta_path):
+    try:
+        with open(meta_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(cache_dir, npy_path, meta_path, rows, meta):
     try:
-        movements = []
-        index = 0
-        gripper_prev = None
-        with open(filename, 'r', newline='') as file:
-            reader = csv.reader(file, delimiter=delimiter)
-            for row in reader:
-                if index == 0:
-                    index += 1
-                    continue
-
-                joint_values = (row[0][1:len(row[0])-1]).split(', ')
-                joint_values_float = []
-
-                for joint in joint_values:
-                    joint_values_float.append(float(joint))
-
-                if joint_values_float[6:9] == status_open: # fully open
-                    if gripper_prev == None or (gripper_prev != None and gripper_prev != status_open):
-                        move = Movement(Mode.OPEN)                        
-                    else:
-                        move = Movement(Mode.MOVE, joint_values_float[0:6])
-                elif joint_values_float[6:9] == status_close: # fully close
-                    if gripper_prev == None or (gripper_prev != None and gripper_prev != status_close):
-                        move = Movement(Mode.CLOSE)                        
-                    else:
-                        move = Movement(Mode.MOVE, joint_values_float[0:6])
-                elif joint_values_float[6:9] == status_half_open: # half open
-                    if gripper_prev == None or (gripper_prev != None and gripper_prev != status_half_open):
-                        move = Movement(Mode.HALF_OPEN)                        
-                    else:
-                        move = Movement(Mode.MOVE, joint_values_float[0:6])
-                elif joint_values_float[6:9] == status_close_tight: # half open
-                    if gripper_prev == None or (gripper_prev != None and gripper_prev != status_close_tight):
-                        move = Movement(Mode.CLOSE_TIGHT)                        
-                    else:
-                        move = Movement(Mode.MOVE, joint_values_float[0:6])
-                else:
-                    move = Movement(Mode.MOVE, joint_values_float[0:6])
-
-                movements.append(move)
-                gripper_prev = joint_values_float[6:9]
-        return movements
-    except Exception as e:
-        raise e
-    
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to temp files first so a crash never leaves a half written cache behind
+        tmp_npy = npy_path + ".tmp"
+        with open(tmp_npy, 'wb') as file:
+            np.save(file, rows)
+        os.replace(tmp_npy, npy_path)
+        _write_cache_meta(meta_path, meta)
+    except OSError as e:
+        logger.warning(f"Could not write trajectory cache {npy_path}: {e}")
+
+def _write_cache_meta(meta_path, meta):
+    tmp_meta = meta_path + ".tmp"
+    with open(tmp_meta, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_meta, meta_path)
+
+def _parse_csv_rows(text, delimiter=','):
+    """Row by row fallback for files the vectorized parser does not understand."""
+    rows = []
+    timestamp_column = None
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    for index, row in enumerate(reader):
+        if index == 0:
+            if "timestamp" in row:
+                timestamp_column = row.index("timestamp")
+            continue
+        if not row:
+            continue
+
+        joint_values = (row[0][1:len(row[0])-1]).split(', ')
+        timestamp = float(row[timestamp_column]) if timestamp_column is not None else len(rows) / RECORDED_FPS
+        rows.append([float(joint) for joint in joint_values] + [timestamp])
+    return np.array(rows, dtype=np.float64).reshape(-1, 10)
+
+def _parse_rows(content, delimiter=','):
+    """
+    Parse a trajectory csv into an (N, 10) array: the observation.state column
+    (6 joints in degree + 3 gripper DO) followed by the timestamp column. One regex cuts
+    both columns out of every line and np.fromstring decodes them, rounding like float().
+    """
+    text = content.decode('utf-8')
+    header = f"observation.state{delimiter}action{delimiter}timestamp{delimiter}"
+
+    rows = None
+    if text.startswith(header):
+        body = text[text.find('\n') + 1:]
+        # every line after the header starts with "[j1, ..., g3]","[...]",timestamp,
+        sep = re.escape(delimiter)
+        columns = re.findall(rf'^"\[([^\]]*)\]"{sep}"\[[^\]]*\]"{sep}([^{sep}\r\n]*)', body, re.MULTILINE)
+        # files with lines in another form (blank ones too) go to the csv fallback
+        num_lines = body.count('\n') + (not body.endswith('\n'))
+        if columns and len(columns) == num_lines:
+            with warnings.catch_warnings():
+                # np.fromstring stops at the first value it cannot read and only warns
+                warnings.simplefilter("error", DeprecationWarning)
+                try:
+                    values = np.fromstring(",".join(f"{state},{timestamp}" for state, timestamp in columns),
+                                           sep=",")
+                except (ValueError, DeprecationWarning):
+                    values = None
+            if values is not None and values.size == 10 * len(columns):
+                rows = values.reshape(-1, 10)
+
+    if rows is None:
+        rows = _parse_csv_rows(text, delimiter)
+    return rows
+
+def load_trajectory_rows(filename, delimiter=',', use_cache=True):
+    """
+    Returns the (N, 10) array of a trajectory csv: observation.state followed by the timestamp.
+    The first load compiles the csv into a .npy file under ROS/trajectories/.cache/,
+    later loads memory-map it. The cache is keyed by path, mtime/size and content hash,
+    so an edited csv is re-parsed automatically.
+    """
+    if not use_cache:
+        with open(filename, 'rb') as file:
+            return _parse_rows(file.read(), delimiter)
+
+    stat = os.stat(filename)
+    abspath = os.path.abspath(filename)
+    loaded = _loaded_rows.get(abspath)
+    if loaded is not None and loaded[:3] == (stat.st_mtime_ns, stat.st_size, delimiter):
+        return loaded[3]
+
+    rows = _load_compiled_rows(filename, delimiter, stat)
+    _loaded_rows[abspath] = (stat.st_mtime_ns, stat.st_size, delimiter, rows)
+    return rows
+
+def load_trajectory_states(filename, delimiter=',', use_cache=True):
+    """Returns the (N, 9) observation.state array of a trajectory csv."""
+    return load_trajectory_rows(filename, delimiter, use_cache)[:, 0:9]
+
+def load_trajectory_timestamps(filename, delimiter=',', use_cache=True):
+    """Returns the recorded timestamp of every row, in seconds from the start of the demo."""
+    return load_trajectory_rows(filename, delimiter, use_cache)[:, 9]
+
+def _load_compiled_rows(filename, delimiter, stat):
+    cache_dir, npy_path, meta_path = _cache_paths(filename)
+    meta = _read_cache_meta(meta_path)
+    if (meta is not None and meta.get("version") == CACHE_VERSION
+            and meta.get("delimiter") == delimiter
+            and meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size):
+        try:
+            return np.load(npy_path, mmap_mode='r')
+        except (OSError, ValueError):
+            meta = None
+
+    with open(filename, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha1(content).hexdigest()
+
+    # touched but unchanged file: keep the compiled data, only refresh the stat key
+    if (meta is not None and meta.get("version") == CACHE_VERSION
+            and meta.get("delimiter") == delimiter and meta.get("sha1") == digest):
+        try:
+            rows = np.load(npy_path, mmap_mode='r')
+            meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_cache_meta(meta_path, meta)
+            return rows
+        except (OSError, ValueError):
+            pass
+
+    rows = _parse_rows(content, delimiter)
+    _write_cache(cache_dir, npy_path, meta_path, rows, {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(filename),
+        "delimiter": delimiter,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha1": digest,
+    })
+    return rows
+
+def classify_states(states):
+    """
+    Returns the Mode value of every row: a gripper mode where the gripper DO switches
+    to one of the known statuses, Mode.MOVE otherwise.
+    """
+    gripper = np.asarray(states)[:, 6:9]
+    matches = (gripper[:, None, :] == _gripper_statuses[None, :, :]).all(axis=2)
+    changed = np.ones(len(gripper), dtype=bool)
+    changed[1:] = (np.diff(gripper, axis=0) != 0).any(axis=1)
+    toggles = changed & matches.any(axis=1)
+
+    modes = np.full(len(gripper), Mode.MOVE.value, dtype=np.int8)
+    modes[toggles] = _gripper_mode_values[matches[toggles].argmax(axis=1)]
+    return modes
+
+def _build_movements(states, modes):
+    joints = np.asarray(states)[:, 0:6].tolist()
+    movements = []
+    for joint_value, mode in zip(joints, modes.tolist()):
+        if mode == Mode.MOVE.value:
+            movements.append(Movement(Mode.MOVE, joint_value))
+        else:
+            movements.append(Movement(Mode(mode)))
+    return movements
+
+def simplify_joint_path(joints, tolerance_deg):
+    """
+    Ramer-Douglas-Peucker in 6-D joint space. Returns a keep mask; the first and last
+    waypoints are always kept and no joint of a dropped waypoint is further than
+    tolerance_deg away from the simplified path.
+    """
+    joints = np.asarray(joints, dtype=np.float64)
+    keep = np.zeros(len(joints), dtype=bool)
+    if len(joints) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(joints) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chord = joints[last] - joints[first]
+        points = joints[first + 1:last] - joints[first]
+        length_sq = chord @ chord
+        if length_sq > 0.0:
+            t = np.clip(points @ chord / length_sq, 0.0, 1.0)
+            deviation = np.abs(points - t[:, None] * chord).max(axis=1)
+        else:
+            deviation = np.abs(points).max(axis=1)
+
+        index = int(deviation.argmax())
+        if deviation[index] > tolerance_deg:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+def simplify_states(states, modes, tolerance_deg):
+    """
+    Keep mask over the rows of a trajectory: every gripper transition row is kept and each
+    run of MOVE rows between them is simplified on its own, so the waypoints right before
+    and after a gripper action stay exactly where they were recorded.
+    """
+    keep = modes != Mode.MOVE.value
+    edges = np.diff((~keep).view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        keep[start:end] = simplify_joint_path(np.asarray(states)[start:end, 0:6], tolerance_deg)
+    return keep
+
+def load_trajectory_from_csv(filename, delimiter=',', use_cache=True, tolerance_deg=None):
+    """
+    Loads a trajectory csv as a list of Movement. With tolerance_deg set, MOVE waypoints
+    are simplified with simplify_states before the list is built.
+    """
+    states = load_trajectory_states(filename, delimiter, use_cache)
+    modes = classify_states(states)
+    if tolerance_deg is not None:
+        keep = simplify_states(states, modes, tolerance_deg)
+        logger.info(f"{os.path.basename(filename)}: simplification removed "
+                    f"{len(keep) - np.count_nonzero(keep)} of {len(keep)} waypoints")
+        states, modes = states[keep], modes[keep]
+    return _build_movements(states, modes)
+
 if __name__ == "__main__":
     movements = load_trajectory_from_csv('ROS/trajectories/spoon_peanuts.csv')
     for move in movements:
         print(move.mode)
-        print(move.joint_value)
\ No newline at end of file
+        print(move.joint_value)
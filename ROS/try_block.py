@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import bisect
+import functools
+import math
+import threading
 import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import rclpy
 from rclpy.node import Node
-from rclpy.executors import SingleThreadedExecutor
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor, SingleThreadedExecutor
 from tm_msgs.srv import SendScript, SetIO
 from tm_msgs.msg import FeedbackState
 from collections import deque
 
 from ROS.robot_state_collector import SingleRobotStateCollector
+from ROS import trajectory_estimator
 
 
 def joints_close(a, b, tol_deg: float = 1.0) -> bool:
@@ -20,8 +27,42 @@ def joints_close(a, b, tol_deg: float = 1.0) -> bool:
     return all(abs(float(x) - float(y)) < tol_deg for x, y in zip(a[:6], b[:6]))
 
 
+def joints_distance(a, b) -> float:
+    return max(abs(float(x) - float(y)) for x, y in zip(a[:6], b[:6]))
+
+
+def guarded(method):
+    """在 controller 的 _lock 之下執行，executor 執行緒與呼叫端執行緒不會同時改動佇列狀態"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._run_guarded(method, self, *args, **kwargs)
+    return wrapper
+
+
 class TMRobotController(Node):
-    def __init__(self, state_collector: SingleRobotStateCollector):
+    # 相鄰兩個 joint 指令的最小變化量，小於此值的點不送出 (與 trajectory_estimator 共用)
+    JOINT_DELTA_THRESHOLD_DEG = trajectory_estimator.JOINT_DELTA_THRESHOLD_DEG
+    # TM5S 各軸最大速度 (deg/s)，PTP 的速度百分比以此為 100%
+    JOINT_MAX_SPEED_DEG_S = trajectory_estimator.JOINT_MAX_SPEED_DEG_S
+    # program 訊息中 grip_type 對應的 End DO 狀態
+    GRIPPER_STATES = {
+        "open": [0, 0, 1],
+        "close": [1, 0, 0],
+        "half_open": [0, 1, 0],
+        "close_tight": [1, 1, 0],
+    }
+    # streaming 模式下，中間點離機器人多近 (deg) 就算經過
+    STREAM_TOL_DEG = 2.0
+    # 一個 SendScript 最多放幾個 PTP，更長的路徑分成多個 script
+    MAX_SCRIPT_MOTIONS = 100
+    # watchdog：指令的 _busy 超過 預估秒數 * WATCHDOG_FACTOR + WATCHDOG_SLACK_S 才強制解鎖
+    WATCHDOG_FACTOR = 1.5
+    WATCHDOG_SLACK_S = 2.0
+    # overrun (實際秒數 - 預估秒數) 直方圖的分界
+    OVERRUN_EDGES_S = (-1.0, -0.25, 0.0, 0.25, 0.5, 1.0, 2.0, 4.0)
+
+    def __init__(self, state_collector: SingleRobotStateCollector, stream_lookahead: int = 0,
+                 compile_segments: bool = False, batch_io: bool = True):
         super().__init__("tm_robot_controller")
 
         self.script_cli = None
@@ -32,11 +73,10 @@ class TMRobotController(Node):
         self.tcp_queue = deque()
 
         self._busy = False
-        self._min_send_interval = 0.2
+        self._min_send_interval = trajectory_estimator.MIN_SEND_INTERVAL_S
         self._last_send_ts = 0.0
 
         self._last_joint_cmd = None
-        should_append = False
 
         self.ee_digital_output = [0, 0, 1, 0]
         self.target_ee_output = None
@@ -45,28 +85,60 @@ class TMRobotController(Node):
 
         self.states_need_to_wait = []
 
-        # add: busy timeout（避免卡死）
+        # streaming 模式：最多 stream_lookahead 個 PTP 已送給手臂但還沒經過，
+        # 由 /joint_states 判斷經過後再補送，不用 _min_send_interval 計時；0 代表關閉
+        # 只有夾爪、要等待的終點這類同步點才讓手臂停下
+        self.stream_lookahead = int(stream_lookahead)
+        self._in_flight = deque()
+
+        # append_timed_joints 把一段路徑編成一個 SendScript，不再每個點呼叫一次服務
+        self.compile_segments = compile_segments
+
+        # 夾爪三個 End DO 用一個 SendScript 的 IO script 一次寫入，只等一個服務回應；
+        # 手臂不接受 (ok=false) 時自動改回每個 pin 一個 SetIO
+        self.batch_io = batch_io
+
+        # MultiThreadedExecutor 下 /joint_states、feedback 與送指令的 callback 在不同執行緒，
+        # 共用的狀態都在 _lock 之下改動；wait_until_idle 等 _idle_futures 完成，不用 spin 迴圈
+        self._lock = threading.RLock()
+        self._idle_futures = []
+        # state_group 收 feedback_states 與 /joint_states，dispatch_group 跑佇列 timer、等待 timer、
+        # 服務回應與到位檢查；送指令只在 dispatch_group 執行緒，不會卡住收狀態
+        self.state_group = MutuallyExclusiveCallbackGroup()
+        self.dispatch_group = MutuallyExclusiveCallbackGroup()
+
+        # add: busy timeout（避免卡死），期限依每個指令的預估時間設定，不再固定 8 秒
         self._busy_started_ts = 0.0
-        self._busy_timeout_s = 8.0  # 可以依情況調整
-
-        self.create_timer(0.01, self._process_queue)
-        self.create_timer(0.05, self._check_joint_reached)
+        self._busy_predicted_s = 0.0
+        self._busy_deadline_ts = 0.0
+        # 已送出的 PTP 預估全部走完的時間，與最後送出的目標關節角
+        self._motion_done_ts = 0.0
+        self._sent_joints = None
+        self._overrun_counts = [0] * (len(self.OVERRUN_EDGES_S) + 1)
+        self.watchdog_timeouts = 0
+
+        self.create_timer(0.01, self._process_queue, callback_group=self.dispatch_group)
+        # 到位由 /joint_states 觸發 guard condition，在 dispatch_group 檢查，不用 timer 輪詢
+        self._latest_joints = None
+        self._joint_guard = self.create_guard_condition(self._on_joint_guard, callback_group=self.dispatch_group)
+        self.state_collector.add_joint_listener(self._on_joint_update)
 
         self.create_subscription(
             FeedbackState,
             "feedback_states",
             self.feedback_callback,
-            10
+            10,
+            callback_group=self.state_group
         )
 
     # ------------------ ROS 服務初始化 ------------------
 
     def setup_services(self):
         self.get_logger().info("等待 ROS 2 服務啟動...")
-        self.script_cli = self.create_client(SendScript, "send_script")
+        self.script_cli = self.create_client(SendScript, "send_script", callback_group=self.dispatch_group)
         while not self.script_cli.wait_for_service(timeout_sec=1.0):
             self.get_logger().info("等待 send_script 服務...")
-        self.io_cli = self.create_client(SetIO, "set_io")
+        self.io_cli = self.create_client(SetIO, "set_io", callback_group=self.dispatch_group)
         while not self.io_cli.wait_for_service(timeout_sec=1.0):
             self.get_logger().info("等待 set_io 服務...")
 
@@ -75,11 +147,32 @@ class TMRobotController(Node):
             (not self.tcp_queue) and
             (not self._busy) and
             (not self.waiting_for_gripper) and
-            (not self.states_need_to_wait)
+            (not self.states_need_to_wait) and
+            (not self._in_flight)
         )
 
+    def _run_guarded(self, callback, *args, **kwargs):
+        with self._lock:
+            result = callback(*args, **kwargs)
+            if self._idle_futures and self.is_idle():
+                futures, self._idle_futures = self._idle_futures, []
+                for future in futures:
+                    future.set_result(True)
+        return result
+
+    def when_idle(self) -> Future:
+        """佇列全部執行完時完成的 Future，executor 在其他執行緒 spin 時用來等待"""
+        future = Future()
+        with self._lock:
+            if self.is_idle():
+                future.set_result(True)
+            else:
+                self._idle_futures.append(future)
+        return future
+
     # ------------------ FeedbackState callback ------------------
 
+    @guarded
     def feedback_callback(self, msg: FeedbackState):
         self.ee_digital_output = list(msg.ee_digital_output)
 
@@ -105,34 +198,83 @@ class TMRobotController(Node):
             self._wait_timer = self.createTimer(seconds, self._gripper_wait_done)
 
     def createTimer(self, period_sec, callback):
-        return self.create_timer(period_sec, callback)
+        return self.create_timer(period_sec, callback, callback_group=self.dispatch_group)
 
+    @guarded
     def _gripper_wait_done(self):
         # self.get_logger().info("✅ 夾爪動作等待完成")
-        self._busy = False
         if hasattr(self, "_wait_timer"):
             self._wait_timer.cancel()
             del self._wait_timer
+        self._command_done()
 
     def _start_arm_wait_timer(self, seconds: float):
-        self._wait_timer_arm = self.create_timer(float(seconds), self._arm_wait_done)
+        self._wait_timer_arm = self.createTimer(float(seconds), self._arm_wait_done)
 
+    @guarded
     def _arm_wait_done(self):
         # self.get_logger().info("✅ 手臂動作等待完成")
-        self._busy = False
         if hasattr(self, "_wait_timer_arm"):
             self._wait_timer_arm.cancel()
             del self._wait_timer_arm
+        self._command_done()
+
+    def _command_done(self):
+        """等待中的指令完成：不等 _min_send_interval 與下一次 timer，馬上送出下一個指令"""
+        if self._busy:
+            overrun = time.time() - self._busy_started_ts - self._busy_predicted_s
+            self._overrun_counts[bisect.bisect_right(self.OVERRUN_EDGES_S, overrun)] += 1
+        self._busy = False
+        self._last_send_ts = 0.0
+        self._process_queue()
 
     # ------------------ joint 到位檢查 ------------------
 
-    def _check_joint_reached(self):
-        """用 /joint_states 的 joints_deg 檢查是否到達等待的目標關節角"""
+    def _on_joint_update(self, joints_deg):
+        """在 collector 的 state_group 執行緒：只記下最新關節角 (複製，ring buffer 會被覆寫) 並喚醒 dispatch_group"""
+        if self.states_need_to_wait or self._in_flight:
+            self._latest_joints = joints_deg.copy()
+            self._joint_guard.trigger()
+
+    @guarded
+    def _on_joint_guard(self):
+        joints_deg = self._latest_joints
+        if joints_deg is None:
+            return
+        if self.states_need_to_wait:
+            self._check_joint_reached(joints_deg)
+        if self._in_flight and self._retire_in_flight(joints_deg):
+            self._process_queue()
+
+    def _retire_in_flight(self, cur, all_points: bool = False) -> bool:
+        """
+        移除手臂已經到達或經過的 in-flight 點並呼叫掛在上面的進度回報，回傳是否有移除。
+        經過 = 離下一個點比這個點離下一個點還近；同步點 (exact) 只認到位。
+        """
+        retired = False
+        while self._in_flight:
+            point = self._in_flight[0]
+            if not all_points:
+                reached = joints_close(cur, point["joints"], tol_deg=self.STREAM_TOL_DEG)
+                passed = (not point["exact"] and len(self._in_flight) > 1 and
+                          joints_distance(cur, self._in_flight[1]["joints"]) <
+                          joints_distance(point["joints"], self._in_flight[1]["joints"]))
+                if not (reached or passed):
+                    break
+            self._in_flight.popleft()
+            retired = True
+            for on_done in point["on_done"]:
+                on_done()
+        return retired
+
+    def _check_joint_reached(self, cur=None):
+        """用 /joint_states 的 joints_deg (numpy array) 檢查是否到達等待的目標關節角"""
         if not self.states_need_to_wait:
             return
 
-        cur = self.state_collector.joints_deg
-        if not cur:
+        if cur is None:
+            cur = self.state_collector.joints_deg
+        if cur is None:
             return
 
         state = self.states_need_to_wait[0]
@@ -142,6 +284,8 @@ class TMRobotController(Node):
             self.get_logger().info(f"✅ 關節到位")
             wait_t = float(state["time_to_wait"])
             self.states_need_to_wait.pop(0)
+            # 同步點之後沒有送出其他 PTP，前面的點都已經經過
+            self._retire_in_flight(cur, all_points=True)
 
             if wait_t > 0.0:
                 self._start_arm_wait_timer(wait_t)
@@ -158,6 +302,10 @@ class TMRobotController(Node):
         self.target_ee_output = list(states)
         self.waiting_for_gripper = True
 
+        if self.batch_io:
+            self._set_io_script(states)
+            return
+
         for pin, state in enumerate(states):
             req = SetIO.Request()
             req.module = 1
@@ -178,19 +326,41 @@ class TMRobotController(Node):
                     self.waiting_for_gripper = False
                     self.target_ee_output = None
 
-            future.add_done_callback(_done)
+            future.add_done_callback(lambda fut, _done=_done: self._run_guarded(_done, fut))
 
+    def _set_io_script(self, states: list):
+        req = SendScript.Request()
+        req.id = "auto"
+        req.script = "\n".join(f'IO["EndModule"].DO[{pin}]={int(state)}' for pin, state in enumerate(states))
+        future = self.script_cli.call_async(req)
+
+        def _done(fut):
+            try:
+                res = fut.result()
+                if not getattr(res, "ok", False):
+                    self.get_logger().warn("⚠️ IO script 回傳 ok=false，改用 SetIO 逐一設定")
+                    self.batch_io = False
+                    self.set_io(states)
+            except Exception as e:
+                self.get_logger().error(f"[IO script 失敗] {e}")
+                self._busy = False
+                self.waiting_for_gripper = False
+                self.target_ee_output = None
+
+        future.add_done_callback(lambda fut: self._run_guarded(_done, fut))
+
+    @guarded
     def append_gripper_states(self, states, wait_after: float = 0.0):
         if not (isinstance(states, (list, tuple)) and len(states) == 3):
             self.get_logger().error("IO 狀態必須為長度 3 的 list，例如 [1,0,0]")
             return
 
-        self._next_gripper_wait_after = float(wait_after)
-
+        # wait_after 跟著指令存，連續排入多個夾爪指令時才不會互相覆蓋
         self.tcp_queue.append({
             "script": f"IO:{states[0]},{states[1]},{states[2]}",
             "wait_time": 2.0,
             "need_wait": False,
+            "wait_after": float(wait_after),
         })
 
     def append_gripper_open(self, wait_after: float = 3.5):
@@ -216,76 +386,219 @@ class TMRobotController(Node):
                      wait_time: float = 0.0,
                      need_wait: bool = False,
                      block: bool = False,
-                     executor: SingleThreadedExecutor = None):
+                     executor: SingleThreadedExecutor = None,
+                     force: bool = False):
         if not (isinstance(joint_values, (list, tuple)) and len(joint_values) == 6):
             self.get_logger().error("Joint 必須 6 個數字")
             return False
 
-        JOINT_DELTA_THRESHOLD_DEG = 4
-        should_append = False
-        if self._last_joint_cmd is None:
-            should_append = True
-        else:
-            for i in range(6):
-                if abs(float(joint_values[i]) - float(self._last_joint_cmd[i])) > JOINT_DELTA_THRESHOLD_DEG:
-                    should_append = True
-                    break
-        if not should_append:
+        # force: 不經過門檻過濾，例如一段路徑的終點
+        if not force and not self._should_append(joint_values):
             return True
 
+        script = self._ptp_script(joint_values, vel, acc, coord, fine)
+        with self._lock:
+            self._last_joint_cmd = list(joint_values)
+            self.tcp_queue.append({
+                "script": script,
+                "wait_time": float(wait_time),
+                "need_wait": bool(need_wait),
+                "joints": list(joint_values),
+                "motions": [(list(joint_values), vel, acc)],
+            })
+
+        if block:
+            # executor 為 None 時，executor 要在其他執行緒 spin
+            ok = self.wait_until_idle(executor, timeout_s=60.0)
+            if not ok:
+                self.get_logger().warn("❌ append_joint block 等待動作失敗或 timeout")
+            return ok
+
+        return True
+
+    @staticmethod
+    def _ptp_script(joint_values, vel, acc, coord, fine) -> str:
         fine_str = "true" if fine else "false"
-        script = (
+        return (
             f'PTP("JPP",{joint_values[0]:.2f}, {joint_values[1]:.2f}, '
             f'{joint_values[2]:.2f}, {joint_values[3]:.2f}, '
             f'{joint_values[4]:.2f}, {joint_values[5]:.2f},'
             f'{vel},{acc},{coord},{fine_str})'
         )
-        self._last_joint_cmd = list(joint_values)
 
-        self.tcp_queue.append({
-            "script": script,
-            "wait_time": float(wait_time),
-            "need_wait": bool(need_wait),
-        })
+    @guarded
+    def append_joint_path(self,
+                          points: list,
+                          blend: int = 100,
+                          wait_time: float = 0.0,
+                          need_wait: bool = False) -> bool:
+        """
+        把連續的 PTP 編成 TMscript，每 MAX_SCRIPT_MOTIONS 個點一個 SendScript。
+        中間點以 blend% 平滑經過，只有最後一點 fine=true；是否完成只看最後一點。
+        points: [(joint_values, vel, acc), ...]，不經過門檻過濾。
+        """
+        if not points:
+            return True
+        if any(not (isinstance(p[0], (list, tuple)) and len(p[0]) == 6) for p in points):
+            self.get_logger().error("Joint 必須 6 個數字")
+            return False
 
-        if need_wait:
-            self.states_need_to_wait.append({
-                "joints": list(joint_values),
-                "time_to_wait": float(wait_time),
+        for start in range(0, len(points), self.MAX_SCRIPT_MOTIONS):
+            chunk = points[start:start + self.MAX_SCRIPT_MOTIONS]
+            final = start + len(chunk) == len(points)
+            lines = []
+            for k, (joint_values, vel, acc) in enumerate(chunk):
+                last = final and k == len(chunk) - 1
+                lines.append(self._ptp_script(joint_values, vel, acc, 0 if last else blend, last))
+            self.tcp_queue.append({
+                "script": "\n".join(lines),
+                "wait_time": float(wait_time) if final else 0.0,
+                "need_wait": bool(need_wait) and final,
+                "joints": list(chunk[-1][0]),
+                "motions": chunk,
             })
+        self._last_joint_cmd = list(points[-1][0])
+        return True
 
-        if block:
-            if executor is None:
-                raise RuntimeError("append_joint(block=True) 需要傳入 executor 才能阻塞等待")
-            ok = self.wait_until_idle(executor, timeout_s=60.0)
-            if not ok:
-                self.get_logger().warn("❌ append_joint block 等待動作失敗或 timeout")
-            return ok
+    def _should_append(self, joint_values) -> bool:
+        if self._last_joint_cmd is None:
+            return True
+        for i in range(6):
+            if abs(float(joint_values[i]) - float(self._last_joint_cmd[i])) > self.JOINT_DELTA_THRESHOLD_DEG:
+                return True
+        return False
+
+    def vel_for_duration(self, joint_from: list, joint_to: list, duration: float,
+                         min_vel: float = 5, max_vel: float = 100) -> int:
+        """走完 joint_from -> joint_to 剛好花 duration 秒所需的 PTP 速度百分比"""
+        return trajectory_estimator.ptp_vel_for_duration(joint_from, joint_to, duration,
+                                                         min_vel=min_vel, max_vel=max_vel)
+
+    @guarded
+    def append_timed_joints(self,
+                            joints_list: list,
+                            time_stamps: list,
+                            speed_factor: float = 1.0,
+                            vel: float = 40,
+                            acc: float = 20,
+                            coord: int = 100,
+                            wait_last: bool = False,
+                            wait_time: float = 0.0) -> bool:
+        """
+        依照錄製的時間戳記 (秒) 排入一段路徑，speed_factor > 1 代表比錄製時更快。
+        被門檻過濾掉的點，其時間會累加到下一個送出的點；第一個點沒有前一個指令可比，使用 vel。
+        wait_last: 終點一定送出，並等關節到位 (再等 wait_time 秒) 才處理下一個指令。
+        compile_segments 時整段編成 append_joint_path 的 script，coord 為中間點的 blend%。
+        """
+        if len(joints_list) != len(time_stamps):
+            self.get_logger().error("joints_list 與 time_stamps 長度不同")
+            return False
+        if speed_factor <= 0.0:
+            self.get_logger().error("speed_factor 必須大於 0")
+            return False
+
+        points = []
+        last_t = None
+        last_index = len(joints_list) - 1
+        for i, (joint_values, t) in enumerate(zip(joints_list, time_stamps)):
+            t = float(t) / speed_factor
+            wait = wait_last and i == last_index
+            if not wait and not self._should_append(joint_values):
+                continue
+            if self._last_joint_cmd is None or last_t is None:
+                point_vel = vel
+            else:
+                point_vel = self.vel_for_duration(self._last_joint_cmd, joint_values, t - last_t)
+            if self.compile_segments:
+                points.append((list(joint_values), point_vel, acc))
+                self._last_joint_cmd = list(joint_values)
+            elif not self.append_joint(list(joint_values), vel=point_vel, acc=acc, coord=coord,
+                                       wait_time=wait_time if wait else 0.0, need_wait=wait, force=wait):
+                return False
+            last_t = t
+        return self.append_joint_path(points, blend=coord, wait_time=wait_time if wait_last else 0.0,
+                                      need_wait=wait_last)
+
+    @guarded
+    def append_program(self, steps: list, on_step_done=None) -> bool:
+        """
+        一次排入整個 program ({"type": "program", "steps": [...]} 的 steps)，
+        robot 連續執行，不用等 GUI 送下一步。arm step 的 joints_values 為 radian。
+        每個 step 完成 (手臂終點到位 / 夾爪等待結束) 後呼叫 on_step_done(step_index)，用來回報進度。
+        """
+        for i, step in enumerate(steps):
+            step_type = step.get("type")
+            if step_type == "arm":
+                joints_deg = [[math.degrees(v) for v in joints] for joints in step["joints_values"]]
+                wait_time = float(step.get("wait_time", 0.0))
+                if "time_stamps" in step:
+                    # time_stamps 已經除過 speed_factor
+                    ok = self.append_timed_joints(joints_deg, step["time_stamps"],
+                                                  wait_last=True, wait_time=wait_time)
+                else:
+                    ok = True
+                    for k, joint_values in enumerate(joints_deg):
+                        last = k == len(joints_deg) - 1
+                        ok = ok and self.append_joint(joint_values, wait_time=wait_time if last else 0.0,
+                                                      need_wait=last, force=last)
+                if not ok:
+                    self.get_logger().error(f"program step {i} 排入失敗")
+                    return False
+            elif step_type == "gripper":
+                states = self.GRIPPER_STATES.get(step.get("grip_type"))
+                if states is None:
+                    self.get_logger().error(f"program step {i} 未知的 grip_type: {step.get('grip_type')}")
+                    return False
+                self.append_gripper_states(states, wait_after=float(step.get("wait_time", 0.0)))
+            else:
+                self.get_logger().error(f"program step {i} 未知的 type: {step_type}")
+                return False
 
+            if on_step_done is not None:
+                # script 為 None 的項目是進度標記，前面的指令都完成後才會輪到它
+                self.tcp_queue.append({"script": None, "on_done": lambda i=i: on_step_done(i)})
         return True
 
     # ------------------ Queue 處理邏輯 ------------------
 
+    @guarded
     def _process_queue(self):
         # add: 如果 busy，就先檢查是否超時
         if self._busy:
-            if self._busy_started_ts > 0 and (time.time() - self._busy_started_ts) > self._busy_timeout_s:
+            if self._busy_deadline_ts > 0 and time.time() > self._busy_deadline_ts:
                 self.get_logger().warning(
-                    f"⚠️ _busy 狀態超過 {self._busy_timeout_s} 秒，"
+                    f"⚠️ _busy 狀態 {time.time() - self._busy_started_ts:.1f} 秒 "
+                    f"(預估 {self._busy_predicted_s:.1f} 秒)，"
                     f"自動解鎖以避免卡死（清空等待狀態）"
                 )
+                self.watchdog_timeouts += 1
                 self._busy = False
                 self.waiting_for_gripper = False
                 self.target_ee_output = None
                 self.states_need_to_wait.clear()
+                self._retire_in_flight(None, all_points=True)
             else:
                 return
 
         if not self.tcp_queue:
             return
 
+        # 進度標記不佔用機器人，連續的標記一次處理完再送下一個指令
+        # streaming 時掛在最後送出的點上，手臂經過那個點才回報
+        while self.tcp_queue and self.tcp_queue[0]["script"] is None:
+            on_done = self.tcp_queue.popleft()["on_done"]
+            if self._in_flight:
+                self._in_flight[-1]["on_done"].append(on_done)
+            else:
+                on_done()
+        if not self.tcp_queue:
+            return
+
         now = time.time()
-        if now - self._last_send_ts < self._min_send_interval:
+        if self.stream_lookahead > 0:
+            if not self._stream_has_room(self.tcp_queue[0]):
+                return
+        elif now - self._last_send_ts < self._min_send_interval:
             return
 
         item = self.tcp_queue.popleft()
@@ -303,15 +616,81 @@ class TMRobotController(Node):
                 _, vals = cmd.split(":")
                 a, b, c = map(int, vals.split(","))
                 self.get_logger().info(f"執行夾爪指令: {cmd}")
+                self._next_gripper_wait_after = float(item.get("wait_after", 0.0))
+                self._set_deadline(now, trajectory_estimator.GRIPPER_SWITCH_S + self._next_gripper_wait_after)
                 self.set_io([a, b, c])
             except Exception as e:
                 self.get_logger().error(f"IO 指令解析失敗: {e}")
                 self._busy = False
             return
 
-        self.get_logger().info(f"執行 PTP(JPP) 腳本: {cmd}")
+        if self.stream_lookahead > 0 and "joints" in item:
+            # 終點後面直接接 PTP 而且不用停留時，照樣串流過去，不當同步點
+            exact = need_wait and (wait_time > 0.0 or not self._next_is_motion())
+            need_wait = exact
+            self._in_flight.append({"joints": item["joints"], "exact": exact, "on_done": []})
+
+        # 手臂依序執行已送出的 PTP，要等到位的指令還要等前面的動作走完
+        self._motion_done_ts = max(now, self._motion_done_ts) + self._predict_motions(item.get("motions", []))
+        self._set_deadline(now, self._motion_done_ts - now + float(wait_time) if need_wait else 0.0)
+
+        if need_wait and "joints" in item:
+            # 送出後才開始比對到位，還沒輪到的目標不會被目前姿態提前滿足
+            self.states_need_to_wait.append({
+                "joints": item["joints"],
+                "time_to_wait": float(wait_time),
+            })
+
+        num_motions = cmd.count("PTP(")
+        if num_motions > 1:
+            self.get_logger().info(f"執行 PTP(JPP) 腳本: {num_motions} 個點，終點 {item['joints']}")
+        else:
+            self.get_logger().info(f"執行 PTP(JPP) 腳本: {cmd}")
         self._send_script_async(cmd, wait_time, need_wait)
 
+    def _predict_motions(self, motions) -> float:
+        """依 vel/acc 預估一串 PTP 的秒數，起點為上一個送出的目標 (沒有時用目前關節角)"""
+        start = self._sent_joints if self._sent_joints is not None else self.state_collector.joints_deg
+        seconds = 0.0
+        for joint_values, vel, acc in motions:
+            if start is not None:
+                seconds += trajectory_estimator.ptp_duration(start, joint_values, vel=vel, acc=acc)
+            start = joint_values
+        if motions:
+            self._sent_joints = list(motions[-1][0])
+        return seconds
+
+    def _set_deadline(self, now: float, predicted_s: float):
+        self._busy_predicted_s = predicted_s
+        self._busy_deadline_ts = now + predicted_s * self.WATCHDOG_FACTOR + self.WATCHDOG_SLACK_S
+
+    def overrun_histogram(self) -> dict:
+        """
+        等待到位 / 夾爪完成的指令，實際秒數超出預估秒數的分布：
+        counts[i] 為落在 edges_s[i-1] 與 edges_s[i] 之間的次數，頭尾兩格不設限；
+        timeouts 為 watchdog 強制解鎖的次數。
+        """
+        with self._lock:
+            return {
+                "edges_s": list(self.OVERRUN_EDGES_S),
+                "counts": list(self._overrun_counts),
+                "timeouts": self.watchdog_timeouts,
+            }
+
+    def _stream_has_room(self, item) -> bool:
+        if not item["script"].startswith("PTP"):
+            # 夾爪等非移動指令要等手臂走完所有已送出的點
+            return not self._in_flight
+        if self._in_flight and self._in_flight[-1]["exact"]:
+            return False
+        return len(self._in_flight) < self.stream_lookahead
+
+    def _next_is_motion(self) -> bool:
+        for item in self.tcp_queue:
+            if item["script"] is not None:
+                return item["script"].startswith("PTP")
+        return False
+
     def _send_script_async(self, script: str, wait_time: float, need_wait: bool):
         req = SendScript.Request()
         req.id = "auto"
@@ -332,14 +711,27 @@ class TMRobotController(Node):
                 self._busy = False
                 self.states_need_to_wait.clear()
 
-        future.add_done_callback(_done)
+        future.add_done_callback(lambda fut: self._run_guarded(_done, fut))
 
     # ------------------ 公用函式 ------------------
 
     def spin_once(self, executor: SingleThreadedExecutor, timeout_sec: float = 0.05):
         executor.spin_once(timeout_sec=timeout_sec)
 
-    def wait_until_idle(self, executor: SingleThreadedExecutor, timeout_s: float = 30.0) -> bool:
+    def wait_until_idle(self, executor: SingleThreadedExecutor = None, timeout_s: float = 30.0) -> bool:
+        """
+        executor 不為 None 時在呼叫端執行緒 spin_once 直到 idle；
+        為 None 時 executor 已經在其他執行緒 spin (MultiThreadedExecutor)，只等 when_idle() 的 Future。
+        """
+        if executor is None:
+            try:
+                return self.when_idle().result(timeout=timeout_s)
+            except FutureTimeoutError:
+                self.get_logger().warn(
+                    f"⚠️ wait_until_idle 超過 timeout_s={timeout_s} 秒，強制結束等待"
+                )
+                return False
+
         start = self.get_clock().now()
         while rclpy.ok() and (not self.is_idle()):
             self.spin_once(executor, timeout_sec=0.05)
@@ -364,9 +756,12 @@ def main():
     collector = SingleRobotStateCollector(fps=30)
     node = TMRobotController(collector)
 
-    executor = SingleThreadedExecutor()
+    # 狀態與送指令分在不同 callback group，各自有執行緒處理
+    executor = MultiThreadedExecutor(num_threads=2)
     executor.add_node(node)
     executor.add_node(collector)
+    spin_thread = threading.Thread(target=executor.spin, daemon=True)
+    spin_thread.start()
 
     try:
         node.setup_services()
@@ -378,22 +773,19 @@ def main():
         node.append_gripper_open()
         node.append_joint(j2, block=False)
 
-        node.append_joint(j1, block=True, executor=executor)
+        node.append_joint(j1, block=True)
         node.append_gripper_close()
         node.append_joint(j3, block=False)
 
         print("hi")
-        while rclpy.ok():
-            node.spin_once(executor, timeout_sec=0.05)
-            if node.is_idle():
-                node.spin_once(executor, timeout_sec=0.0)
-                node.get_logger().info("✅ 佇列處理完成，自動結束程式")
-                break
+        node.when_idle().result()
+        node.get_logger().info("✅ 佇列處理完成，自動結束程式")
 
     except KeyboardInterrupt:
         node.get_logger().info("⛔ 手動中斷程式")
     finally:
         executor.shutdown()
+        spin_thread.join(timeout=1.0)
         node.destroy_node()
         collector.destroy_node()
         rclpy.shutdown()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
+import threading
 import rclpy
-from rclpy.executors import SingleThreadedExecutor
+from rclpy.executors import MultiThreadedExecutor
 from robot_state_collector import SingleRobotStateCollector
 from try_block import TMRobotController
 
@@ -9,22 +10,25 @@ def main():
 
     collector = SingleRobotStateCollector(fps=30)
     ctrl = TMRobotController(collector)
-    ctrl.setup_services()
-    executor = SingleThreadedExecutor()
+    executor = MultiThreadedExecutor(num_threads=2)
     executor.add_node(collector)
     executor.add_node(ctrl)
+    spin_thread = threading.Thread(target=executor.spin, daemon=True)
+    spin_thread.start()
+    ctrl.setup_services()
 
     j1 = [2.01, -10.63, 120.00, 70.83, -87.79, 179.26]
     j2 = [2.01, -10.63, 140.18, 70.83, -87.79, 179.26]
     ctrl.append_joint(j1)
     ctrl.append_gripper_close()
-    ctrl.append_joint(j2,block=True, executor=executor,  )
+    ctrl.append_joint(j2, block=True)
 
     print("這行會等到上一個 joint 完成才印")
 
 
     #----------------結束整個程式才需要--------------
     executor.shutdown()
+    spin_thread.join(timeout=1.0)
     ctrl.destroy_node()
     collector.destroy_node()
     rclpy.shutdown()
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import struct
+import sys
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+import GraspGen.graspgen_comm as graspgen_comm
+from GraspGen.graspgen_comm import AsyncGraspGenCommunication
+from test_ros_comm import free_ports
+
+class LateServer:
+    """
+    Stand-in for a GraspGen server that answers every request after delay seconds, on a
+    connection to port_out. Like servers from before the hello, it ignores hellos.
+    """
+
+    def __init__(self, port_in, port_out, delay):
+        self.port_in = port_in
+        self.port_out = port_out
+        self.delay = delay
+        self.count = 0
+        self._out = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "localhost", self.port_in, reuse_address=True)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                length = struct.unpack(">I", await reader.readexactly(4))[0]
+                if json.loads(await reader.readexactly(length)).get("type") == "hello":
+                    continue
+                self.count += 1
+                asyncio.ensure_future(self._send({"reply_to": self.count}))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def _send(self, reply):
+        await asyncio.sleep(self.delay)
+        if self._out is None:
+            _, self._out = await asyncio.open_connection("localhost", self.port_out)
+        message_bytes = json.dumps(reply).encode("utf-8")
+        self._out.write(struct.pack(">I", len(message_bytes)) + message_bytes)
+        await self._out.drain()
+
+    async def stop(self):
+        if self._out is not None:
+            self._out.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+async def request_after_deadline(delay=0.5, duplex=False):
+    port_in, port_out = free_ports(2)
+    server = LateServer(port_in, port_out, delay)
+    await server.start()
+    comm = AsyncGraspGenCommunication(port_in, port_out, duplex)
+    await comm.start()
+    try:
+        try:
+            await comm.send_data({"task": "grasp"})
+        except TimeoutError:
+            timed_out = True
+        else:
+            timed_out = False
+        replies = [await comm.send_data({"task": "grasp"}, timeout=2.0) for _ in range(2)]
+    finally:
+        await comm.quit()
+        await server.stop()
+    return timed_out, replies
+
+def test_request_times_out_by_default_and_late_reply_is_dropped(monkeypatch):
+    monkeypatch.setattr(graspgen_comm, "DEFAULT_DEADLINE_S", 0.2)
+    timed_out, replies = asyncio.run(request_after_deadline())
+    assert timed_out
+    assert [reply["reply_to"] for reply in replies] == [2, 3]
+
+def test_unanswered_hello_does_not_take_the_first_reply():
+    # the hello times out, the requests after it still get their own replies
+    timed_out, replies = asyncio.run(request_after_deadline(delay=0.0, duplex=True))
+    assert not timed_out
+    assert [reply["reply_to"] for reply in replies] == [2, 3]
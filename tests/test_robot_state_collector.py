@@ -0,0 +1,90 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+# the collector needs a ROS 2 install with tm_msgs (the TM driver)
+rclpy = pytest.importorskip("rclpy")
+pytest.importorskip("tm_msgs")
+from sensor_msgs.msg import JointState
+from ROS.robot_state_collector import SingleRobotStateCollector
+
+@pytest.fixture(scope="module", autouse=True)
+def ros():
+    rclpy.init()
+    yield
+    rclpy.shutdown()
+
+@pytest.fixture
+def collector():
+    collector = SingleRobotStateCollector(history_size=4)
+    yield collector
+    collector.destroy_node()
+
+def joint_state(first_joint_deg):
+    msg = JointState()
+    msg.position = np.radians([first_joint_deg, 10.0, 20.0, 30.0, 40.0, 50.0]).tolist()
+    return msg
+
+def test_ring_buffer_wraps_around(collector):
+    for value in range(1, 7):
+        collector._on_joint(joint_state(value))
+    assert collector.joints_deg[0] == pytest.approx(6.0)
+    stamps, joints = collector.joint_history()
+    # one slot is kept free for the row being written
+    assert joints[:, 0] == pytest.approx([4.0, 5.0, 6.0])
+    assert np.all(np.diff(stamps) >= 0.0)
+    assert collector.joint_history(2)[1][:, 0] == pytest.approx([5.0, 6.0])
+
+def test_zero_rows_and_short_messages_are_skipped(collector):
+    collector._on_joint(joint_state(1.0))
+    collector._on_joint(JointState())
+    zeros = JointState()
+    zeros.position = [0.0] * 6
+    collector._on_joint(zeros)
+    assert collector.joint_history()[1][:, 0] == pytest.approx([1.0])
+
+def test_listeners_get_every_row(collector):
+    received = []
+    collector.add_joint_listener(lambda joints_deg: received.append(joints_deg.copy()))
+    for value in range(1, 6):
+        collector._on_joint(joint_state(value))
+    assert [joints[0] for joints in received] == pytest.approx([1.0, 2.0, 3.0, 4.0, 5.0])
+
+class CatchUp:
+    """Ring buffer that lets the writer lap the reader once, between reading the stamps and the joints."""
+
+    def __init__(self, collector, values):
+        self.collector = collector
+        self.history = collector._history
+        self.values = values
+
+    def __getitem__(self, index):
+        if isinstance(index, np.ndarray) and self.values:
+            values, self.values = self.values, []
+            for value in values:
+                self.collector._on_joint(joint_state(value))
+        return self.history[index]
+
+def test_history_read_retries_when_the_writer_laps_it(collector):
+    for value in range(1, 4):
+        collector._on_joint(joint_state(value))
+    collector._history = CatchUp(collector, [4.0, 5.0, 6.0])
+    stamps, joints = collector.joint_history()
+    assert joints[:, 0] == pytest.approx([4.0, 5.0, 6.0])
+    assert len(stamps) == 3
+
+def test_velocity_and_acceleration_fit(collector):
+    t = np.arange(4) * 0.1
+    for value in 10.0 + 5.0 * t + 3.0 * t ** 2:
+        collector._on_joint(joint_state(value))
+    # 4 rows in a 4 slot buffer: the fit uses the last 3
+    collector._stamps[np.arange(4)] = t
+    velocity, acceleration = collector.joint_velocity_acceleration()
+    assert velocity[0] == pytest.approx(5.0 + 6.0 * t[-1])
+    assert acceleration[0] == pytest.approx(6.0)
+    assert velocity[1:] == pytest.approx(np.zeros(5), abs=1e-9)
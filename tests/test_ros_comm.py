@@ -0,0 +1,179 @@
+import asyncio
+import os
+import socket
+import struct
+import sys
+import time
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.ros_comm import HELLO_TIMEOUT_S, AsyncROSCommunication
+from ROS.socket_communication import JSONCodec, codec_hello_reply, decode_frame, encode_frame, frame_length
+from ROS.trajectory_estimator import APPROACH_BOUND_S, estimate_steps
+from ROS.trajectory_library import build_plan
+from ROS.trajectory_parser import Mode
+
+def free_ports(n):
+    sockets = [socket.socket() for _ in range(n)]
+    for sock in sockets:
+        sock.bind(("localhost", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+def sample_plan():
+    """Two short arm segments around a gripper close."""
+    states = np.zeros((5, 9))
+    states[:, 0] = [0.0, 5.0, 10.0, 10.0, 15.0]
+    states[3:, 6] = 1.0
+    modes = np.array([Mode.MOVE.value, Mode.MOVE.value, Mode.MOVE.value, Mode.CLOSE.value, Mode.MOVE.value])
+    return build_plan(states, modes, np.arange(5) / 30.0)
+
+class FakeBridge:
+    """
+    Stand-in for the ROS bridge: reads frames at port_in and replies on a connection to
+    port_out. reply(message) returns the (delay, reply) pairs to send for a message.
+    """
+
+    def __init__(self, port_in, port_out, reply):
+        self.port_in = port_in
+        self.port_out = port_out
+        self.reply = reply
+        self.received = []
+        self._out = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "localhost", self.port_in, reuse_address=True)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                header = struct.unpack(">I", await reader.readexactly(4))[0]
+                request_id, message = decode_frame(header, await reader.readexactly(frame_length(header)))
+                self.received.append(message)
+                for delay, reply in self.reply(message):
+                    asyncio.ensure_future(self._send(delay, reply))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def _send(self, delay, reply):
+        await asyncio.sleep(delay)
+        if self._out is None:
+            _, self._out = await asyncio.open_connection("localhost", self.port_out)
+        self._out.write(encode_frame(reply, JSONCodec()))
+        await self._out.drain()
+
+    async def stop(self):
+        if self._out is not None:
+            self._out.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+def legacy_reply(message):
+    """A bridge from before the hello: ignores unknown messages, acks arm and gripper steps."""
+    if message.get("type") in ("arm", "gripper"):
+        return [(0.0, {"type": "done", "step": message["type"]})]
+    return []
+
+def program_reply(message):
+    """A bridge that runs programs and says so in its hello reply."""
+    if message.get("type") == "hello":
+        return [(0.0, codec_hello_reply(message))]
+    if message.get("type") == "program":
+        replies = [(0.0, {"type": "progress", "step": i}) for i in range(len(message["steps"]))]
+        return replies + [(0.0, {"type": "program_done"})]
+    return [(0.0, {"type": "done"})]
+
+async def run_plan_against(reply, program_mode=True):
+    port_in, port_out = free_ports(2)
+    bridge = FakeBridge(port_in, port_out, reply)
+    await bridge.start()
+    comm = AsyncROSCommunication(port_in, port_out, program_mode)
+    await comm.start()
+    progress = []
+    try:
+        start = time.monotonic()
+        result = await comm.run_plan(sample_plan(), progress.append)
+        elapsed = time.monotonic() - start
+    finally:
+        await comm.quit()
+        await bridge.stop()
+    return result, elapsed, progress, bridge.received
+
+def test_legacy_bridge_gets_one_message_per_step():
+    result, elapsed, progress, received = asyncio.run(run_plan_against(legacy_reply))
+    types = [message.get("type") for message in received]
+    assert "program" not in types
+    assert types == ["hello", "arm", "gripper", "arm"]
+    assert result == {"type": "done", "step": "arm"}
+    assert len(progress) == 3
+    # only the unanswered hello is waited for, not the deadline of a program
+    assert elapsed < HELLO_TIMEOUT_S + 1.0
+
+def test_program_bridge_gets_one_program():
+    result, elapsed, progress, received = asyncio.run(run_plan_against(program_reply))
+    assert [message.get("type") for message in received] == ["hello", "program"]
+    assert result == {"type": "program_done"}
+    assert [reply["step"] for reply in progress] == [0, 1, 2]
+
+def test_default_client_sends_no_hello():
+    result, elapsed, progress, received = asyncio.run(run_plan_against(legacy_reply, program_mode=False))
+    assert [message.get("type") for message in received] == ["arm", "gripper", "arm"]
+    assert elapsed < HELLO_TIMEOUT_S
+
+def slow_hello_reply(message):
+    """A bridge that answers the hello only after HELLO_TIMEOUT_S and every step after 1 s."""
+    if message.get("type") == "hello":
+        return [(HELLO_TIMEOUT_S + 0.5, codec_hello_reply(message, program=False))]
+    return [(1.0, {"type": "done", "step": message["type"]})]
+
+def test_late_hello_reply_is_not_taken_for_a_step_reply():
+    result, elapsed, progress, received = asyncio.run(run_plan_against(slow_hello_reply))
+    assert [message.get("type") for message in received] == ["hello", "arm", "gripper", "arm"]
+    assert [update["reply"]["step"] for update in progress] == ["arm", "gripper", "arm"]
+
+def late_reply():
+    """A bridge without request IDs that answers every step after 0.5 s."""
+    count = [0]
+    def reply(message):
+        if message.get("type") != "gripper":
+            return []
+        count[0] += 1
+        return [(0.5, {"type": "done", "reply_to": count[0]})]
+    return reply
+
+async def send_after_timeout():
+    port_in, port_out = free_ports(2)
+    bridge = FakeBridge(port_in, port_out, late_reply())
+    await bridge.start()
+    comm = AsyncROSCommunication(port_in, port_out, program_mode=False)
+    await comm.start()
+    step = {"type": "gripper", "grip_type": "close", "wait_time": 0.0}
+    try:
+        try:
+            await comm.send_data(step, timeout=0.2)
+        except TimeoutError:
+            timed_out = True
+        else:
+            timed_out = False
+        replies = [await comm.send_data(step, timeout=2.0) for _ in range(2)]
+    finally:
+        await comm.quit()
+        await bridge.stop()
+    return timed_out, replies
+
+def test_late_reply_does_not_shift_later_replies():
+    timed_out, replies = asyncio.run(send_after_timeout())
+    assert timed_out
+    assert [reply["reply_to"] for reply in replies] == [2, 3]
+
+def test_first_step_estimate_covers_the_approach_from_any_pose():
+    plan = sample_plan()
+    far_pose = [-270.0, -180.0, -155.0, -180.0, -180.0, -270.0]
+    bounded = estimate_steps(plan, approach_s=APPROACH_BOUND_S)
+    assert bounded[0] >= estimate_steps(plan, far_pose)[0]
+    assert bounded[1:] == estimate_steps(plan)[1:]
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from GraspGen.common_utils.shared_frames import SharedFrameWriter
+
+# the server side: another process attaches to the segments by name
+SERVER = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from GraspGen.common_utils.shared_frames import read_frame
+frames = []
+for descriptor in json.load(sys.stdin):
+    try:
+        frame = read_frame(descriptor)
+        frames.append({"dtype": frame.dtype.str, "values": frame.tolist()})
+    except FileNotFoundError:
+        frames.append(None)
+json.dump(frames, sys.stdout)
+"""
+
+def read_in_server(*descriptors):
+    result = subprocess.run([sys.executable, "-c", SERVER, project_root_dir], input=json.dumps(descriptors),
+                            capture_output=True, text=True, check=True)
+    return [None if frame is None else np.array(frame["values"], dtype=frame["dtype"])
+            for frame in json.loads(result.stdout)]
+
+@pytest.fixture
+def writer():
+    writer = SharedFrameWriter(prefix="robotsnack_test")
+    yield writer
+    writer.close()
+
+def test_server_reads_the_published_arrays(writer):
+    depth = np.arange(12, dtype=np.uint16).reshape(3, 4)
+    descriptor = writer.publish("depth", depth, timestamp=1.5)
+    assert descriptor["shape"] == [3, 4] and descriptor["timestamp"] == 1.5
+    cloud = np.random.default_rng(0).random((100, 3))
+    frames = read_in_server(descriptor, writer.publish("cloud", cloud))
+    assert frames[0].dtype == depth.dtype and np.array_equal(frames[0], depth)
+    assert np.array_equal(frames[1], cloud)
+
+def test_slots_keep_the_frame_in_flight(writer):
+    first = writer.publish("color", np.zeros((2, 2, 3), dtype=np.uint8))
+    second = writer.publish("color", np.ones((2, 2, 3), dtype=np.uint8))
+    assert first["name"] != second["name"]
+    assert [frame.max() for frame in read_in_server(first, second)] == [0, 1]
+    assert writer.publish("color", np.zeros(1, dtype=np.uint8))["name"] == first["name"]
+
+def test_larger_frame_replaces_the_segment(writer):
+    writer.publish("cloud", np.zeros((4, 3), dtype=np.float32))
+    writer.publish("cloud", np.zeros((4, 3), dtype=np.float32))
+    cloud = np.arange(300, dtype=np.float64).reshape(100, 3)
+    assert np.array_equal(read_in_server(writer.publish("cloud", cloud))[0], cloud)
+
+def test_server_does_not_unlink_and_close_does():
+    writer = SharedFrameWriter(prefix="robotsnack_test")
+    descriptor = writer.publish("depth", np.ones(4))
+    # the server exiting leaves the segment to the writer
+    read_in_server(descriptor)
+    assert read_in_server(descriptor)[0].tolist() == [1.0] * 4
+    writer.close()
+    assert read_in_server(descriptor) == [None]
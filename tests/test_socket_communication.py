@@ -0,0 +1,54 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.socket_communication import (BinaryCodec, JSONCodec, codec_hello_reply, decode_frame, encode_frame,
+                                      frame_length, make_codec)
+from test_ros_comm import sample_plan
+
+def round_trip(data, codec, request_id=None):
+    frame = encode_frame(data, codec, request_id)
+    header = struct.unpack(">I", frame[:4])[0]
+    assert frame_length(header) == len(frame) - 4
+    return decode_frame(header, frame[4:])
+
+def test_binary_codec_round_trip_keeps_arrays():
+    message = sample_plan().to_message()
+    request_id, decoded = round_trip(message, BinaryCodec(), request_id=7)
+    assert request_id == 7
+    for sent, received in zip(message["steps"], decoded["steps"]):
+        assert sent.keys() == received.keys()
+        for key, value in sent.items():
+            if isinstance(value, np.ndarray):
+                assert received[key].dtype == value.dtype
+                assert np.array_equal(received[key], value)
+            else:
+                assert received[key] == value
+
+def test_binary32_sends_float64_as_float32():
+    joints = np.linspace(0.0, 1.0, 12).reshape(2, 6)
+    _, decoded = round_trip({"joints": joints, "index": np.arange(3)}, make_codec("binary32"))
+    assert decoded["joints"].dtype == np.float32
+    assert np.allclose(decoded["joints"], joints)
+    assert decoded["index"].dtype == np.arange(3).dtype
+
+def test_decoded_arrays_do_not_alias_the_frame():
+    frame = bytearray(encode_frame({"a": np.ones(3)}, BinaryCodec()))
+    _, decoded = decode_frame(struct.unpack(">I", frame[:4])[0], frame[4:])
+    frame[-8:] = bytes(8)
+    assert decoded["a"].tolist() == [1.0, 1.0, 1.0]
+
+def test_json_frames_stay_plain_without_request_id():
+    frame = encode_frame({"type": "arm", "joints_values": np.zeros((1, 6))}, JSONCodec())
+    assert json.loads(frame[4:]) == {"type": "arm", "joints_values": [[0.0] * 6]}
+    assert round_trip('{"type": "program"}', BinaryCodec()) == (None, {"type": "program"})
+
+def test_hello_reply_picks_the_first_supported_codec():
+    reply = codec_hello_reply({"type": "hello", "codecs": ["msgpack", "binary", "json"], "ids": True})
+    assert reply == {"type": "hello", "codec": "binary", "ids": True}
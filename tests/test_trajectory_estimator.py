@@ -0,0 +1,58 @@
+import math
+import os
+import sys
+
+import pytest
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.trajectory_estimator import (GRIPPER_SWITCH_S, MIN_SEND_INTERVAL_S, estimate_arm_step, estimate_message,
+                                      estimate_plan, estimate_steps, ptp_duration, ptp_vel_for_duration)
+from test_ros_comm import sample_plan
+
+def joints(*first_joint):
+    return [[value, 0.0, 0.0, 0.0, 0.0, 0.0] for value in first_joint]
+
+def test_ptp_duration_trapezoid_and_triangle():
+    # joint 1 at 40% of 180 deg/s, 20 ms to reach it
+    assert ptp_duration([0.0] * 6, [72.0] + [0.0] * 5) == pytest.approx(1.0 + 0.02)
+    # too short to reach top speed: accelerate half way, brake the rest
+    assert ptp_duration([0.0] * 6, [0.36] + [0.0] * 5) == pytest.approx(2.0 * math.sqrt(0.36 * 0.02 / 72.0))
+    assert ptp_duration([0.0] * 6, [0.0] * 6) == 0.0
+
+def test_ptp_duration_is_set_by_the_slowest_joint():
+    # joint 4 is faster (225 deg/s), the same distance on joint 1 takes longer
+    assert ptp_duration([0.0] * 6, [0.0, 0.0, 0.0, 90.0, 0.0, 0.0]) == pytest.approx(90.0 / 90.0 + 0.02)
+    assert ptp_duration([0.0] * 6, [90.0, 0.0, 0.0, 90.0, 0.0, 0.0]) == pytest.approx(90.0 / 72.0 + 0.02)
+
+def test_ptp_vel_for_duration_meets_the_recorded_time():
+    start, end = [0.0] * 6, [30.0, 10.0, 0.0, 0.0, 0.0, 0.0]
+    vel = ptp_vel_for_duration(start, end, 0.5)
+    assert vel == math.ceil(30.0 / 180.0 / 0.5 * 100.0)
+    assert ptp_duration(start, end, vel=vel) <= 0.5 + 0.02
+    assert ptp_vel_for_duration(start, end, 0.0) == 100
+    assert ptp_vel_for_duration(start, start, 1.0) == 5
+
+def test_estimate_arm_step_skips_small_moves_and_paces_sends():
+    move = ptp_duration([0.0] * 6, [10.0] + [0.0] * 5)
+    # 2 deg is under JOINT_DELTA_THRESHOLD_DEG; the end point is always sent
+    duration, last_cmd = estimate_arm_step(joints(0.0, 2.0, 10.0, 20.0), last_cmd=[0.0] * 6)
+    assert duration == pytest.approx(max(move, MIN_SEND_INTERVAL_S) + move)
+    assert last_cmd == joints(20.0)[0]
+
+def test_estimate_arm_step_approach():
+    duration, _ = estimate_arm_step(joints(0.0), approach_s=3.0)
+    assert duration == 3.0
+    assert estimate_arm_step(joints(0.0))[0] == 0.0
+
+def test_estimate_steps_gripper_and_wait_times():
+    plan = sample_plan()
+    seconds = estimate_steps(plan, last_cmd=[0.0] * 6)
+    assert len(seconds) == 3
+    assert seconds[1] == pytest.approx(GRIPPER_SWITCH_S + plan.wait_times[1])
+    # the last arm step starts from the pose the first one ended at (10 deg)
+    assert seconds[2] == pytest.approx(ptp_duration(joints(10.0)[0], joints(15.0)[0]) + plan.wait_times[2])
+    assert sum(seconds) == pytest.approx(estimate_plan(plan, [0.0] * 6))
+    assert estimate_message({"type": "gripper", "wait_time": 1.5}) == GRIPPER_SWITCH_S + 1.5
+    assert estimate_message({"type": "hello"}) is None
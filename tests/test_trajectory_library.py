@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+from ROS.trajectory_library import GRIPPER_COMMANDS, build_plan
+from ROS.trajectory_parser import Mode
+
+def rows(first_joint, modes):
+    states = np.zeros((len(modes), 9))
+    states[:, 0] = first_joint
+    return states, np.array([mode.value for mode in modes])
+
+def test_build_plan_offsets_and_wait_times():
+    states, modes = rows([0, 1, 2, 2, 2, 3, 4, 4],
+                         [Mode.MOVE, Mode.MOVE, Mode.MOVE, Mode.CLOSE, Mode.OPEN, Mode.MOVE, Mode.MOVE, Mode.HALF_OPEN])
+    plan = build_plan(states, modes)
+    assert plan.modes.tolist() == [Mode.MOVE.value, Mode.CLOSE.value, Mode.OPEN.value, Mode.MOVE.value,
+                                   Mode.HALF_OPEN.value]
+    # gripper steps own no waypoints
+    assert plan.offsets.tolist() == [0, 3, 3, 3, 5, 5]
+    assert plan.wait_times.tolist() == [0.0, GRIPPER_COMMANDS[Mode.CLOSE][1], GRIPPER_COMMANDS[Mode.OPEN][1], 0.0,
+                                        GRIPPER_COMMANDS[Mode.HALF_OPEN][1]]
+    assert np.degrees(plan.segment(3)[0][:, 0]).tolist() == pytest.approx([3.0, 4.0])
+    assert plan.step(1) == {"type": "gripper", "grip_type": "close", "wait_time": GRIPPER_COMMANDS[Mode.CLOSE][1]}
+
+def test_build_plan_time_stamps_restart_per_segment():
+    states, modes = rows([0, 1, 1, 2, 3], [Mode.MOVE, Mode.MOVE, Mode.CLOSE, Mode.MOVE, Mode.MOVE])
+    plan = build_plan(states, modes, np.arange(5) / 10.0, speed_factor=2.0)
+    assert plan.time_stamps.tolist() == pytest.approx([0.0, 0.05, 0.0, 0.05])
+    assert plan.step(2)["speed_factor"] == 2.0
+
+def test_build_plan_starting_with_a_gripper_step():
+    states, modes = rows([0, 0, 1], [Mode.OPEN, Mode.MOVE, Mode.MOVE])
+    plan = build_plan(states, modes)
+    assert plan.offsets.tolist() == [0, 0, 2]
+    assert not plan.is_arm(0) and plan.num_waypoints(1) == 2
+
+def test_step_json_matches_json_dumps():
+    states, modes = rows([0.1, 1.7, 1.7, 2.3], [Mode.MOVE, Mode.MOVE, Mode.CLOSE, Mode.MOVE])
+    plan = build_plan(states, modes, np.arange(4) / 30.0)
+    for i in range(len(plan)):
+        assert plan.step_json(i) == json.dumps(plan.step(i))
+    assert json.loads(plan.to_json())["steps"] == [plan.step(i) for i in range(len(plan))]
+
+def test_build_plan_rejects_non_positive_speed_factor():
+    states, modes = rows([0, 1], [Mode.MOVE, Mode.MOVE])
+    with pytest.raises(ValueError):
+        build_plan(states, modes, speed_factor=0.0)
@@ -0,0 +1,129 @@
+import os
+import sys
+
+import numpy as np
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+import ROS.trajectory_parser as trajectory_parser
+from ROS.trajectory_parser import (Mode, _cache_paths, _parse_csv_rows, classify_states, load_trajectory_rows,
+                                   simplify_joint_path, simplify_states)
+
+HEADER = "observation.state,action,timestamp,frame_index,episode_index,index,task_index\n"
+
+def csv_text(rows):
+    """Trajectory csv in the recorded format, rows are (9 state values, timestamp)."""
+    lines = [HEADER]
+    for index, (state, timestamp) in enumerate(rows):
+        values = ", ".join(str(float(value)) for value in state)
+        lines.append(f'"[{values}]","[{values}]",{timestamp},{index},0,{index},0\n')
+    return "".join(lines)
+
+def write_csv(path, rows):
+    path.write_text(csv_text(rows))
+    return str(path)
+
+def sample_rows(n=4, offset=0.0):
+    return [([offset + i, -43.24, 119.41, 115.29, -95.12, 184.31, 0.0, 0.0, 0.0], i / 30.0) for i in range(n)]
+
+def test_compiled_rows_match_the_csv_parser(tmp_path):
+    filename = write_csv(tmp_path / "demo.csv", sample_rows())
+    rows = load_trajectory_rows(filename)
+    expected = _parse_csv_rows(csv_text(sample_rows()))
+    assert rows.shape == (4, 10)
+    assert np.array_equal(rows, expected)
+    assert all(os.path.exists(path) for path in _cache_paths(filename)[1:])
+
+def test_cache_key_depends_on_the_path(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first = _cache_paths(str(tmp_path / "a" / "demo.csv"))
+    second = _cache_paths(str(tmp_path / "b" / "demo.csv"))
+    assert first[1] != second[1]
+    assert os.path.basename(first[1]).startswith("demo-")
+
+def test_edited_csv_is_parsed_again(tmp_path):
+    filename = write_csv(tmp_path / "demo.csv", sample_rows())
+    load_trajectory_rows(filename)
+    write_csv(tmp_path / "demo.csv", sample_rows(n=5, offset=1.0))
+    # another process: only the files under .cache/ are left
+    trajectory_parser._loaded_rows.clear()
+    rows = load_trajectory_rows(filename)
+    assert rows.shape == (5, 10)
+    assert rows[0, 0] == 1.0
+
+def test_touched_csv_keeps_the_compiled_rows(tmp_path, monkeypatch):
+    filename = write_csv(tmp_path / "demo.csv", sample_rows())
+    expected = np.array(load_trajectory_rows(filename))
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    trajectory_parser._loaded_rows.clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("unchanged csv was parsed again")
+    monkeypatch.setattr(trajectory_parser, "_parse_rows", fail)
+    assert np.array_equal(load_trajectory_rows(filename), expected)
+
+def test_cache_of_another_version_is_not_used(tmp_path, monkeypatch):
+    filename = write_csv(tmp_path / "demo.csv", sample_rows())
+    load_trajectory_rows(filename)
+    trajectory_parser._loaded_rows.clear()
+    monkeypatch.setattr(trajectory_parser, "CACHE_VERSION", trajectory_parser.CACHE_VERSION + 1)
+    calls = []
+    parse_rows = trajectory_parser._parse_rows
+    monkeypatch.setattr(trajectory_parser, "_parse_rows", lambda *args: calls.append(args) or parse_rows(*args))
+    load_trajectory_rows(filename)
+    assert len(calls) == 1
+
+def test_classify_states_marks_gripper_switches_only():
+    states = np.zeros((7, 9))
+    states[:, 0] = np.arange(7)
+    states[2:4, 6:9] = trajectory_parser.status_close
+    states[4, 6:9] = trajectory_parser.status_close_tight
+    states[5:, 6:9] = trajectory_parser.status_half_open
+    modes = classify_states(states)
+    assert modes.tolist() == [Mode.OPEN.value, Mode.MOVE.value, Mode.CLOSE.value, Mode.MOVE.value,
+                              Mode.CLOSE_TIGHT.value, Mode.HALF_OPEN.value, Mode.MOVE.value]
+
+def test_classify_states_ignores_unknown_gripper_statuses():
+    states = np.zeros((3, 9))
+    states[:, 6:9] = [[0, 0, 1], [0, 0, 1], [0, 0, 0]]
+    assert classify_states(states).tolist() == [Mode.MOVE.value, Mode.MOVE.value, Mode.OPEN.value]
+
+def test_simplify_joint_path_keeps_corners_within_tolerance():
+    joints = np.zeros((9, 6))
+    joints[:5, 0] = np.arange(5)
+    joints[4:, 0] = 4.0
+    joints[4:, 1] = np.arange(5)
+    joints[2, 2] = 0.05
+    keep = simplify_joint_path(joints, tolerance_deg=0.1)
+    assert np.flatnonzero(keep).tolist() == [0, 4, 8]
+
+def test_simplify_joint_path_bounds_the_deviation():
+    t = np.linspace(0.0, np.pi, 60)
+    joints = np.zeros((len(t), 6))
+    joints[:, 0] = np.degrees(t)
+    joints[:, 1] = 20.0 * np.sin(t)
+    keep = simplify_joint_path(joints, tolerance_deg=0.5)
+    assert keep[0] and keep[-1] and 2 < np.count_nonzero(keep) < len(joints)
+    kept = np.flatnonzero(keep)
+    for first, last in zip(kept[:-1], kept[1:]):
+        for index in range(first + 1, last):
+            # dropped points lie within tolerance of the chord they were replaced by
+            chord = joints[last] - joints[first]
+            u = np.clip((joints[index] - joints[first]) @ chord / (chord @ chord), 0.0, 1.0)
+            assert np.abs(joints[index] - joints[first] - u * chord).max() <= 0.5
+
+def test_simplify_joint_path_short_paths():
+    assert simplify_joint_path(np.zeros((0, 6)), 1.0).tolist() == []
+    assert simplify_joint_path(np.zeros((1, 6)), 1.0).tolist() == [True]
+    assert simplify_joint_path(np.zeros((3, 6)), 1.0).tolist() == [True, False, True]
+
+def test_simplify_states_keeps_gripper_rows_and_their_neighbours():
+    states = np.zeros((9, 9))
+    states[:, 0] = np.arange(9)
+    modes = np.full(9, Mode.MOVE.value)
+    modes[4] = Mode.CLOSE.value
+    keep = simplify_states(states, modes, tolerance_deg=0.1)
+    assert np.flatnonzero(keep).tolist() == [0, 3, 4, 5, 8]
@@ -0,0 +1,137 @@
+import os
+import sys
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+project_root_dir = os.path.dirname(current_file_dir)
+sys.path.insert(0, project_root_dir)
+# the controller needs a ROS 2 install with tm_msgs (the TM driver)
+rclpy = pytest.importorskip("rclpy")
+pytest.importorskip("tm_msgs")
+from ROS import try_block
+from ROS.robot_state_collector import SingleRobotStateCollector
+from ROS.trajectory_estimator import GRIPPER_SWITCH_S, ptp_duration
+from ROS.try_block import TMRobotController
+
+class FakeClient:
+    """Stand-in for a service client: records the requests, the test completes their futures."""
+
+    def __init__(self):
+        self.calls = []
+
+    def call_async(self, request):
+        future = Future()
+        self.calls.append((request, future))
+        return future
+
+@pytest.fixture(scope="module", autouse=True)
+def ros():
+    rclpy.init()
+    yield
+    rclpy.shutdown()
+
+@pytest.fixture
+def controller():
+    collector = SingleRobotStateCollector()
+    controller = TMRobotController(collector)
+    controller.script_cli = FakeClient()
+    controller.io_cli = FakeClient()
+    yield controller
+    controller.destroy_node()
+    collector.destroy_node()
+
+def path(n):
+    return [([float(i), -10.0, 120.0, 70.0, -88.0, 179.0], 40, 20) for i in range(n)]
+
+def test_joint_path_blends_through_all_but_the_last_point(controller):
+    assert controller.append_joint_path(path(3), blend=80, wait_time=0.5, need_wait=True)
+    item, = controller.tcp_queue
+    lines = item["script"].split("\n")
+    assert len(lines) == 3
+    assert all(line.endswith(",40,20,80,false)") for line in lines[:2])
+    assert lines[2].endswith(",40,20,0,true)")
+    # completion is tracked against the last point only
+    assert item["joints"] == path(3)[-1][0]
+    assert item["need_wait"] and item["wait_time"] == 0.5
+
+def test_long_joint_path_is_split_into_scripts(controller, monkeypatch):
+    monkeypatch.setattr(TMRobotController, "MAX_SCRIPT_MOTIONS", 2)
+    controller.append_joint_path(path(5), wait_time=1.0, need_wait=True)
+    items = list(controller.tcp_queue)
+    assert [item["script"].count("PTP(") for item in items] == [2, 2, 1]
+    # the last point of an inner script still blends into the next script
+    assert items[1]["script"].endswith(",100,false)")
+    assert [item["need_wait"] for item in items] == [False, False, True]
+    assert [item["wait_time"] for item in items] == [0.0, 0.0, 1.0]
+
+def test_joint_path_is_sent_in_one_service_call(controller):
+    controller.append_joint_path(path(4), need_wait=True)
+    controller._process_queue()
+    (request, _), = controller.script_cli.calls
+    assert request.script.count("PTP(") == 4
+    assert controller.states_need_to_wait == [{"joints": path(4)[-1][0], "time_to_wait": 0.0}]
+
+def test_gripper_pins_are_written_by_one_io_script(controller):
+    controller.append_gripper_states([1, 0, 1])
+    controller._process_queue()
+    (request, future), = controller.script_cli.calls
+    assert request.script == 'IO["EndModule"].DO[0]=1\nIO["EndModule"].DO[1]=0\nIO["EndModule"].DO[2]=1'
+    future.set_result(SimpleNamespace(ok=True))
+    assert controller.io_cli.calls == []
+    assert controller.waiting_for_gripper and controller.target_ee_output == [1, 0, 1]
+
+def test_rejected_io_script_falls_back_to_set_io(controller):
+    controller.append_gripper_close()
+    controller._process_queue()
+    (_, future), = controller.script_cli.calls
+    future.set_result(SimpleNamespace(ok=False))
+    assert not controller.batch_io
+    assert [(request.pin, request.state) for request, _ in controller.io_cli.calls] == [(0, 1.0), (1, 0.0), (2, 0.0)]
+    # later gripper commands go straight to SetIO
+    controller.set_io([0, 0, 1])
+    assert len(controller.script_cli.calls) == 1 and len(controller.io_cli.calls) == 6
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls time.time() inside try_block."""
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(try_block, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def watchdog_deadline(start, predicted_s):
+    return start + predicted_s * TMRobotController.WATCHDOG_FACTOR + TMRobotController.WATCHDOG_SLACK_S
+
+def test_arm_deadline_follows_the_predicted_move(controller, clock):
+    controller._sent_joints = [0.0] * 6
+    target = [72.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    controller.append_joint(target, vel=40, acc=20, wait_time=0.5, need_wait=True)
+    controller._process_queue()
+    predicted = ptp_duration([0.0] * 6, target, vel=40, acc=20) + 0.5
+    assert controller._busy_deadline_ts == pytest.approx(watchdog_deadline(100.0, predicted))
+
+def test_watchdog_clears_a_stuck_gripper_only_after_the_deadline(controller, clock):
+    controller.append_gripper_close(wait_after=2.0)
+    controller._process_queue()
+    deadline = watchdog_deadline(100.0, GRIPPER_SWITCH_S + 2.0)
+    assert controller._busy_deadline_ts == pytest.approx(deadline)
+
+    clock.now = deadline - 0.01
+    controller._process_queue()
+    assert controller._busy and controller.watchdog_timeouts == 0
+    clock.now = deadline + 0.01
+    controller._process_queue()
+    assert not controller._busy and not controller.waiting_for_gripper
+    assert controller.overrun_histogram()["timeouts"] == 1
+
+def test_overrun_histogram_counts_finished_commands(controller, clock):
+    controller.append_gripper_close(wait_after=0.0)
+    controller._process_queue()
+    clock.now += GRIPPER_SWITCH_S + 0.3
+    controller._gripper_wait_done()
+    histogram = controller.overrun_histogram()
+    # 0.3 s late lands between the 0.25 and 0.5 edges
+    index = histogram["edges_s"].index(0.5)
+    assert histogram["counts"][index] == 1 and sum(histogram["counts"]) == 1